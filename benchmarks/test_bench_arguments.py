@@ -0,0 +1,311 @@
+"""`tellurium.arguments` のデコーダのベンチマーク (pytest-benchmark)
+
+    $ make bench            # 保存した基準値と比較する
+    $ make bench-baseline   # 基準値を保存し直す
+
+設定の形ごとに合成したデータで `obj_to_dataclass`, `instantiate_generic`,
+`isinstance_generic`, `dataclass_to_obj`, `asdict` の時間を計測する。
+"""
+
+import dataclasses as _dc
+import functools as _ft
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any, Optional, Union
+
+import pytest
+import yaml as _yaml
+
+from tellurium import _yamlio
+from tellurium.arguments import (
+    asdict,
+    dataclass_to_obj,
+    instantiate_generic,
+    isinstance_generic,
+    obj_to_dataclass,
+)
+from tellurium.fsindex import DirectoryIndex
+from tellurium.functional import path_to_str
+
+
+@_dc.dataclass
+class Source:
+    path: str
+    flags: list[str]
+
+
+@_dc.dataclass
+class Command:
+    args: list[str]
+    env: dict[str, str]
+
+
+@_dc.dataclass
+class Task:
+    input: str
+    output: str
+    config: str
+
+
+DEPTH = 50
+
+
+def make_levels(depth: int) -> list[type]:
+    # 前方参照は解決しないため、深さごとに別のデータクラスを作る
+    levels = [_dc.make_dataclass(f"Level{depth}", [("value", int)])]
+    for i in reversed(range(depth)):
+        fields = [("value", int), ("child", Optional[levels[-1]], None)]
+        levels.append(_dc.make_dataclass(f"Level{i}", fields))
+    return levels[::-1]
+
+
+Levels = make_levels(DEPTH)
+
+# フィールドが多いデータクラス
+Wide = _dc.make_dataclass(
+    "Wide", [(f"field{i:03d}", Union[int, str, list[float]]) for i in range(300)]
+)
+
+Step = Union[Source, Command, int, str]
+
+LENGTH = 10_000
+FILES = 2_000
+RULES = 200
+
+
+def nested(depth: int) -> dict:
+    obj: dict = {"value": depth}
+    for value in reversed(range(depth)):
+        obj = {"value": value, "child": obj}
+    return obj
+
+
+def wide() -> dict:
+    values = [1, "text", [0.5, 1.5]]
+    return {f.name: values[i % 3] for i, f in enumerate(_dc.fields(Wide))}
+
+
+def steps(n: int) -> list:
+    items = [
+        {"TYPE": "Source", "ARGS": {"path": "src/a.c", "flags": ["-O2", "-g"]}},
+        {"TYPE": "Command", "ARGS": {"args": ["cc", "-c"], "env": {"CC": "gcc"}}},
+        42,
+        "echo",
+    ]
+    return [items[i % len(items)] for i in range(n)]
+
+
+def large_dict(n: int) -> dict[str, list[int]]:
+    return {f"key{i:06d}": list(range(i % 8)) for i in range(n)}
+
+
+def matrix(n: int) -> dict:
+    return {
+        "FUNC": "Matrix",
+        "ARGS": {
+            "mapping": {
+                "input": [f"{i}.toml" for i in range(n)],
+                "config": ["debug", "release"],
+            },
+            "template": {
+                "input": {"FUNC": "Placeholder", "ARGS": {"key": "input"}},
+                "output": {
+                    "FUNC": "PatSubst",
+                    "ARGS": {
+                        "pattern": "%.toml",
+                        "replacement": "%.png",
+                        "texts": {"FUNC": "Placeholder", "ARGS": {"key": "input"}},
+                    },
+                },
+                "config": {"FUNC": "Placeholder", "ARGS": {"key": "config"}},
+            },
+        },
+    }
+
+
+def rules_config(n: int) -> list[dict]:
+    return [
+        {
+            "target": f"build/obj/{i:06d}.o",
+            "dependencies": [f"src/{i:06d}.c", f"include/{i % 100:03d}.h"],
+            "command": ["cc", "-O2", "-c", f"src/{i:06d}.c", "-o", f"{i:06d}.o"],
+            "options": {"optimize": True, "level": i % 4, "scale": i / 7},
+            "note": _yamlio.BlockScalarStr(f"rule {i}\ngenerated\n"),
+        }
+        for i in range(n)
+    ]
+
+
+# libyaml がない場合の純 Python 実装と比較する
+YAML_IMPLEMENTATIONS = {"python": (_yaml.SafeLoader, _yaml.SafeDumper)}
+if _yaml.__with_libyaml__:
+    YAML_IMPLEMENTATIONS["libyaml"] = (_yaml.CSafeLoader, _yaml.CSafeDumper)
+
+
+@pytest.fixture(params=list(YAML_IMPLEMENTATIONS))
+def yaml_implementation(request: pytest.FixtureRequest) -> tuple[type, type]:
+    loader, base_dumper = YAML_IMPLEMENTATIONS[request.param]
+    dumper = type("Dumper", (base_dumper,), {})
+    dumper.add_representer(_yamlio.BlockScalarStr, _yamlio.block_scalar_representer)
+    return loader, dumper
+
+
+@pytest.fixture(scope="module")
+def tree(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    root = tmp_path_factory.mktemp("tree")
+    for i in range(FILES):
+        path = root / f"dir{i % 20:02d}" / f"{i:05d}.c"
+        path.parent.mkdir(exist_ok=True)
+        path.touch()
+    return root
+
+
+@pytest.fixture(scope="module")
+def deep_tree(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    """2 階層に分かれたファイルと、除外する .git を持つディレクトリ"""
+    root = tmp_path_factory.mktemp("deep_tree")
+    for i in range(FILES):
+        path = root / f"top{i % 16:02d}" / f"sub{i % 97:02d}" / f"{i:07d}.dat"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+    (root / ".git" / "objects").mkdir(parents=True)
+    for i in range(FILES // 10):
+        (root / ".git" / "objects" / f"{i:07d}").touch()
+    return root
+
+
+def pathlib_glob(pattern: str) -> list[str]:
+    return [path_to_str(path) for path in Path(".").glob(pattern)]
+
+
+def index_glob(pattern: str, threads: int = 1, exclude: tuple[str, ...] = ()):
+    index = DirectoryIndex(threads=threads)
+    return [index.path_to_str(path) for path in index.glob(pattern, exclude)]
+
+
+GLOBS: dict[str, Callable[[str], list[str]]] = {
+    "pathlib": pathlib_glob,
+    "index": index_glob,
+    "index_threads": _ft.partial(index_glob, threads=8),
+    "index_exclude": _ft.partial(index_glob, exclude=(".git",)),
+}
+
+
+@pytest.mark.parametrize("implementation", list(GLOBS))
+def test_wildcard_glob(
+    benchmark, implementation: str, deep_tree: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    glob = GLOBS[implementation]
+    monkeypatch.chdir(deep_tree)
+    result = benchmark(glob, "**/*.dat")
+    # `Path.glob` と同じ順序で同じ結果を返す
+    assert result == pathlib_glob("**/*.dat")
+
+
+def test_decode_deep(benchmark) -> None:
+    obj = nested(DEPTH)
+    result = benchmark(obj_to_dataclass, Levels[0], obj)
+    assert result.child.child.value == 2
+
+
+def test_decode_wide(benchmark) -> None:
+    result = benchmark(obj_to_dataclass, Wide, wide())
+    assert result.field002 == [0.5, 1.5]
+
+
+def test_decode_union_list(benchmark) -> None:
+    result = benchmark(obj_to_dataclass, list[Step], steps(LENGTH))
+    assert len(result) == LENGTH
+
+
+def test_decode_large_dict(benchmark) -> None:
+    result = benchmark(obj_to_dataclass, dict[str, list[int]], large_dict(LENGTH))
+    assert len(result) == LENGTH
+
+
+@pytest.mark.parametrize("n", [10, 100, 1_000])
+def test_decode_matrix(benchmark, n: int) -> None:
+    result = benchmark(obj_to_dataclass, list[Task], matrix(n))
+    assert len(result) == 2 * n
+
+
+def test_decode_wildcard_patsubst(
+    benchmark, tree: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tree)
+    obj = {
+        "sources": {"FUNC": "Wildcard", "ARGS": {"pattern": "**/*.c"}},
+        "objects": {
+            "FUNC": "PatSubst",
+            "ARGS": {
+                "pattern": "%.c",
+                "replacement": "%.o",
+                "texts": {"FUNC": "Wildcard", "ARGS": {"pattern": "**/*.c"}},
+            },
+        },
+    }
+    result = benchmark(obj_to_dataclass, dict[str, list[str]], obj)
+    assert len(result["objects"]) == FILES
+
+
+def test_yaml_dump(benchmark, yaml_implementation: tuple[type, type]) -> None:
+    _, dumper = yaml_implementation
+    config = rules_config(RULES)
+    text = benchmark(_yaml.dump, config, Dumper=dumper, sort_keys=False)
+    # どちらの実装でも同じ出力になる
+    assert text == _yamlio.dump(config)
+
+
+def test_yaml_load(benchmark, yaml_implementation: tuple[type, type]) -> None:
+    loader, _ = yaml_implementation
+    text = _yamlio.dump(rules_config(RULES))
+    result = benchmark(_yaml.load, text, Loader=loader)
+    assert len(result) == RULES
+
+
+def test_instantiate_generic(benchmark) -> None:
+    obj = {f"key{i}": [i, str(i)] for i in range(LENGTH)}
+    typ = dict[str, list[Union[int, str]]]
+    result = benchmark(instantiate_generic, obj, typ)
+    assert result == obj
+
+
+# 名前 -> (型, データを作る関数)
+UNION_PAYLOADS: dict[str, tuple[Any, Callable[[], Any]]] = {
+    "list_of_union": (
+        list[Union[int, str]],
+        lambda: [i if i % 2 else str(i) for i in range(LENGTH)],
+    ),
+    "union_of_lists": (
+        Union[list[int], list[str]],
+        lambda: [str(i) for i in range(LENGTH)],
+    ),
+    "union_of_dicts": (
+        Union[dict[str, list[int]], dict[str, list[str]]],
+        lambda: {f"k{i}": [str(j) for j in range(100)] for i in range(LENGTH // 100)},
+    ),
+}
+
+
+@pytest.mark.parametrize("payload", list(UNION_PAYLOADS))
+def test_instantiate_generic_union(benchmark, payload: str) -> None:
+    typ, make = UNION_PAYLOADS[payload]
+    obj = make()
+    # 後ろの候補に一致する場合も、一致した候補を 1 回だけ変換する
+    assert benchmark(instantiate_generic, obj, typ) == obj
+
+
+def test_isinstance_generic(benchmark) -> None:
+    obj = large_dict(LENGTH)
+    assert benchmark(isinstance_generic, obj, dict[str, list[int]])
+
+
+def test_dataclass_to_obj(benchmark) -> None:
+    obj = benchmark(dataclass_to_obj, Wide)
+    assert len(obj) == len(_dc.fields(Wide))
+
+
+def test_asdict(benchmark) -> None:
+    data = obj_to_dataclass(list[Step], steps(LENGTH))
+    result = benchmark(asdict, data, list[Step])
+    assert len(result) == LENGTH
@@ -0,0 +1,58 @@
+"""`tellurium.make` の実行計画のベンチマーク (pytest-benchmark)
+
+10^5 個のルールと 10^6 本の依存関係を持つグラフで、依存関係の番号付け
+(`_RuleGraph.compile`) と実行順序の決定 (`_RuleGraph.order`) の時間を計測する。
+"""
+
+from pathlib import Path
+
+import pytest
+
+from tellurium.make import BuildRule, _RuleGraph
+
+RULES = 100_000
+FANOUT = 10
+
+
+def layered_rules(n: int, paths: list[Path]) -> dict[str, BuildRule]:
+    # ルール i は自身より番号の小さいルールに依存する
+    return {
+        str(paths[i]): BuildRule(
+            paths[i],
+            [paths[i * j // (FANOUT + 1)] for j in range(1, FANOUT + 1) if i],
+            [],
+        )
+        for i in range(n)
+    }
+
+
+@pytest.fixture(scope="module")
+def rules() -> dict[str, BuildRule]:
+    # 依存先は対象のルールと同じ Path オブジェクト (文字列への変換は 1 回だけ)
+    return layered_rules(RULES, [Path(str(i)) for i in range(RULES)])
+
+
+def test_rule_graph_compile(benchmark, rules: dict[str, BuildRule]) -> None:
+    graph = benchmark(_RuleGraph.compile, rules)
+    assert len(graph.names) == RULES
+
+
+def test_rule_graph_compile_fresh_paths(benchmark) -> None:
+    # YAML からデコードした場合のように、依存先ごとに別の Path を作る
+    n = RULES // 10
+
+    def setup():
+        paths = [Path(str(i)) for i in range(n)]
+        rules = layered_rules(n, paths)
+        for rule in rules.values():
+            rule.dependencies = [Path(str(dep)) for dep in rule.dependencies]
+        return (rules,), {}
+
+    graph = benchmark.pedantic(_RuleGraph.compile, setup=setup, rounds=3)
+    assert len(graph.names) == n
+
+
+def test_rule_graph_order(benchmark, rules: dict[str, BuildRule]) -> None:
+    graph = _RuleGraph.compile(rules)
+    order = benchmark(graph.order)
+    assert len(order) == RULES
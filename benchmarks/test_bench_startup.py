@@ -0,0 +1,55 @@
+"""`tellurium` の読み込み時間のベンチマーク (pytest-benchmark)
+
+`python -X importtime` でモジュールごとの読み込み時間を調べ、tellurium 自身の
+モジュールにかかった時間が上限を超えないことを確かめる。
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+# tellurium 自身のモジュールの読み込みにかける時間の上限 (マイクロ秒)
+IMPORT_BUDGET_US = 20_000
+
+
+def import_times(args: list[str], env: dict[str, str]) -> dict[str, int]:
+    """`python -X importtime` で読み込まれたモジュールと自身の読み込み時間"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, _, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(self_us)
+    return times
+
+
+@pytest.fixture
+def env(tmp_path: Path) -> dict[str, str]:
+    env = dict(os.environ)
+    # バイトコードのキャッシュがないとコンパイルの時間まで計測される
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    env["PYTHONPYCACHEPREFIX"] = str(tmp_path / "pycache")
+    return env
+
+
+def test_import_arguments(benchmark, env: dict[str, str]) -> None:
+    args = ["-c", "import tellurium.arguments, tellurium.make"]
+    # 1 回目はバイトコードを作る
+    import_times(args, env)
+    runs: list[dict[str, int]] = []
+    benchmark.pedantic(lambda: runs.append(import_times(args, env)), rounds=5)
+    best = min(
+        sum(t for name, t in times.items() if name.startswith("tellurium"))
+        for times in runs
+    )
+    assert best < IMPORT_BUDGET_US, f"{best=} us"
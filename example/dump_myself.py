@@ -1,8 +1,6 @@
 import dataclasses as _dc
 import typing as _ty
 
-import yaml as _yaml
-
 from tellurium.arguments import make_from_arguments
 
 
@@ -24,6 +22,8 @@ class DumpMyself:
     opt_float_with_default: _ty.Optional[float] = None
 
     def run(self) -> None:
+        import yaml as _yaml
+
         with open(self.output, "w") as f:
             _yaml.safe_dump(
                 _dc.asdict(self), f, default_flow_style=False, sort_keys=False
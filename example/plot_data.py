@@ -2,11 +2,12 @@ import dataclasses as _dc
 import typing as _ty
 from pathlib import Path
 
-import matplotlib.pyplot as plt
-import numpy as np
-
 from tellurium.arguments import make_from_arguments
 
+# matplotlib と numpy は読み込みに時間がかかるため、引数の解析後に読み込む
+if _ty.TYPE_CHECKING:
+    import numpy as np
+
 
 @_dc.dataclass
 class Main:
@@ -22,7 +23,9 @@ class Main:
             self.input = [self.input]
 
     @staticmethod
-    def load_dat(input_file: Path) -> np.ndarray:
+    def load_dat(input_file: Path) -> "np.ndarray":
+        import numpy as np
+
         with open(input_file) as f:
             lines = f.readlines()
 
@@ -35,6 +38,8 @@ class Main:
         return np.genfromtxt(lines[non_comment_idx:])
 
     def run(self):
+        import matplotlib.pyplot as plt
+
         for file in ["../.matplotlibrc", "../../.matplotlibrc"]:
             if Path(file).exists():
                 plt.style.use(file)
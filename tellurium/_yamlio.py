@@ -0,0 +1,124 @@
+# PyYAML の読み込みには時間がかかるため、`tellurium.arguments` は YAML を
+# 読み書きするときに初めてこのモジュールを読み込む
+import typing as _ty
+
+import yaml as _yaml
+
+# PyYAML が libyaml 付きでビルドされている場合は C 実装を使う
+if _yaml.__with_libyaml__:
+    Loader: type[_ty.Any] = _yaml.CSafeLoader
+    BaseDumper: type[_ty.Any] = _yaml.CSafeDumper
+else:
+    Loader = _yaml.SafeLoader
+    BaseDumper = _yaml.SafeDumper
+
+
+class Dumper(BaseDumper):
+    pass
+
+
+class BlockScalarStr(str):
+    pass
+
+
+def block_scalar_representer(dumper, data):
+    # C 実装の Emitter は str のサブクラスを受け付けない
+    return dumper.represent_scalar("tag:yaml.org,2002:str", str(data), style="|")
+
+
+_yaml.add_representer(BlockScalarStr, block_scalar_representer, Dumper=Dumper)
+
+
+STR_TAG = "tag:yaml.org,2002:str"
+_resolver = _yaml.resolver.Resolver()
+MAPPING_START = _yaml.MappingStartEvent(
+    None, "tag:yaml.org,2002:map", True, flow_style=False
+)
+MAPPING_END = _yaml.MappingEndEvent()
+SEQUENCE_START = _yaml.SequenceStartEvent(
+    None, "tag:yaml.org,2002:seq", True, flow_style=False
+)
+SEQUENCE_END = _yaml.SequenceEndEvent()
+
+
+def str_event(value: str) -> _yaml.ScalarEvent:
+    detected = _resolver.resolve(_yaml.ScalarNode, value, (True, False))
+    return _yaml.ScalarEvent(None, STR_TAG, (detected == STR_TAG, True), value)
+
+
+def emit_node(dumper, node: _yaml.Node) -> None:
+    # `Serializer.serialize_node` からアンカーの処理を除いたもの
+    if isinstance(node, _yaml.ScalarNode):
+        detected = dumper.resolve(_yaml.ScalarNode, node.value, (True, False))
+        default = dumper.resolve(_yaml.ScalarNode, node.value, (False, True))
+        implicit = (node.tag == detected, node.tag == default)
+        event = _yaml.ScalarEvent(
+            None, node.tag, implicit, node.value, style=node.style
+        )
+        dumper.emit(event)
+    elif isinstance(node, _yaml.SequenceNode):
+        implicit = node.tag == dumper.resolve(_yaml.SequenceNode, node.value, True)
+        dumper.emit(
+            _yaml.SequenceStartEvent(
+                None, node.tag, implicit, flow_style=node.flow_style
+            )
+        )
+        for item in node.value:
+            emit_node(dumper, item)
+        dumper.emit(SEQUENCE_END)
+    elif isinstance(node, _yaml.MappingNode):
+        implicit = node.tag == dumper.resolve(_yaml.MappingNode, node.value, True)
+        dumper.emit(
+            _yaml.MappingStartEvent(
+                None, node.tag, implicit, flow_style=node.flow_style
+            )
+        )
+        for key, value in node.value:
+            emit_node(dumper, key)
+            emit_node(dumper, value)
+        dumper.emit(MAPPING_END)
+
+
+def emit_value(dumper, value) -> None:
+    t = type(value)
+    if t is str:
+        dumper.emit(str_event(value))
+    elif t is dict:
+        dumper.emit(MAPPING_START)
+        for k, v in value.items():
+            emit_value(dumper, k)
+            emit_value(dumper, v)
+        dumper.emit(MAPPING_END)
+    elif t is list or t is tuple:
+        dumper.emit(SEQUENCE_START)
+        for v in value:
+            emit_value(dumper, v)
+        dumper.emit(SEQUENCE_END)
+    else:
+        emit_node(dumper, dumper.represent_data(value))
+
+
+def load(stream):
+    return _yaml.load(stream, Loader=Loader)
+
+
+def load_all(stream) -> _ty.Iterator:
+    return _yaml.load_all(stream, Loader=Loader)
+
+
+def dump(data, stream=None):
+    return _yaml.dump(
+        data, stream, Dumper=Dumper, default_flow_style=False, sort_keys=False
+    )
+
+
+def emit_document(stream, emit, data) -> None:
+    dumper = Dumper(stream, default_flow_style=False, sort_keys=False)
+    try:
+        dumper.emit(_yaml.StreamStartEvent())
+        dumper.emit(_yaml.DocumentStartEvent(explicit=False))
+        emit(dumper, data)
+        dumper.emit(_yaml.DocumentEndEvent(explicit=False))
+        dumper.emit(_yaml.StreamEndEvent())
+    finally:
+        dumper.dispose()
@@ -1,20 +1,36 @@
+import collections.abc as _abc
+import contextlib as _contextlib
+import copy as _copy
 import dataclasses as _dc
+import functools as _ft
 import itertools as _it
+import math as _math
+import os
+import sys
 import typing as _ty
-from argparse import ArgumentParser
 from pathlib import Path
-from string import Template
 
-import yaml as _yaml
+from . import fsindex as _fsindex
 
-from . import functional as _func
+# 起動を速くするため、以下のモジュールは使うときに読み込む
+if _ty.TYPE_CHECKING:
+    import argparse as _argparse
+    import concurrent.futures as _futures
+
+    from . import cache as _cache
+    from . import functional as _func
 
 __all__ = [
     "isinstance_generic",
     "obj_to_dataclass",
+    "iter_obj_to_dataclass",
+    "IncrementalDecoder",
+    "DecodeProfile",
+    "LazyMatrix",
     "dataclass_to_obj",
     "emit_yaml_example",
     "make_from_arguments",
+    "dump_yaml",
 ]
 _T = _ty.TypeVar("_T")
 
@@ -27,42 +43,273 @@ def _is_optional(cls: type[_ty.Any]):
     )
 
 
-def isinstance_generic(obj, typ: type[_ty.Any]) -> bool:
-    if typ is _ty.Any:
+def _type_key(cls: type[_ty.Any]) -> _ty.Hashable:
+    if isinstance(cls, type):
+        return cls
+    # `Union[int, str] == Union[str, int]` となるため、順序を区別できる repr も含める
+    return (cls, repr(cls))
+
+
+class _TypeCache[V]:
+    """型ごとに `make(cls)` の結果を `_type_key` をキーとして保持する
+
+    ハッシュできない型はキャッシュせず、毎回 `make` を呼ぶ。
+    """
+
+    def __init__(self, make: _ty.Callable[[_ty.Any], V]) -> None:
+        self._make = make
+        self._values: dict[_ty.Hashable, V] = {}
+
+    def get(self, cls: _ty.Any) -> V:
+        key = _type_key(cls)
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        except TypeError:
+            return self._make(cls)
+        value = self._values[key] = self._make(cls)
+        return value
+
+    @_contextlib.contextmanager
+    def registering(self, cls: _ty.Any, value: V) -> _ty.Iterator[None]:
+        """`make` の途中で `cls` の値を先に登録する
+
+        再帰的なデータクラスのフィールドから自身を参照できるようにするため、
+        フィールドを調べる前に使う。ブロック内で失敗した場合は登録を取り消す。
+        """
+        key = _type_key(cls)
+        try:
+            self._values[key] = value
+        except TypeError:
+            yield
+            return
+        try:
+            yield
+        except BaseException:
+            del self._values[key]
+            raise
+
+
+@_dc.dataclass(eq=False)
+class _TypeInfo:
+    """型の構造を `typing` と `dataclasses` から一度だけ調べてまとめたもの
+
+    デコーダと `dataclass_to_obj` はこれをもとに型を辿る。
+    """
+
+    typ: _ty.Any
+    kind: _ty.Literal[
+        "dataclass",
+        "optional",
+        "union",
+        "literal",
+        "list",
+        "dict",
+        "array",
+        "any",
+        "other",
+    ]
+    origin: _ty.Any
+    args: tuple
+    fields: tuple[_dc.Field, ...] = ()
+
+
+def _make_type_info(cls: type[_ty.Any]) -> _TypeInfo:
+    origin = _ty.get_origin(cls)
+    args = _ty.get_args(cls)
+    if _dc.is_dataclass(cls):
+        return _TypeInfo(cls, "dataclass", origin, args, _dc.fields(cls))
+    if _is_optional(cls):
+        return _TypeInfo(cls, "optional", origin, args)
+    if origin is _ty.Union:
+        return _TypeInfo(cls, "union", origin, args)
+    if origin is _ty.Literal:
+        return _TypeInfo(cls, "literal", origin, args)
+    if origin is list or cls is list:
+        return _TypeInfo(cls, "list", origin, args or (_ty.Any,))
+    if origin is dict or cls is dict:
+        return _TypeInfo(cls, "dict", origin, args or (_ty.Any, _ty.Any))
+    if cls is _ty.Any:
+        return _TypeInfo(cls, "any", origin, args)
+    array_info = _make_array_type_info(cls, origin, args)
+    if array_info is not None:
+        return array_info
+    return _TypeInfo(cls, "other", origin, args)
+
+
+_type_infos = _TypeCache(_make_type_info)
+_get_type_info = _type_infos.get
+
+
+# 配列の要素の型の種類 (`dtype.kind`) -> 要素ごとに変換する場合の Python の型
+_DTYPE_KIND_TYPES: dict[str, type] = {
+    "b": bool,
+    "i": int,
+    "u": int,
+    "f": float,
+    "c": complex,
+}
+
+
+def _make_array_type_info(cls, origin, args) -> _ty.Optional[_TypeInfo]:
+    """`array.array[T]` や `numpy.typing.NDArray[T]` の型情報
+
+    `args` は (要素ごとに変換する場合の型, `array` の typecode または dtype)。
+    これらのモジュールは注釈に使われていれば読み込み済みのため、ここでは読み込まない。
+    """
+    array_module = sys.modules.get("array")
+    if array_module is not None and array_module.array in (cls, origin):
+        item_t = args[0] if args else _ty.Any
+        typecode = {float: "d", int: "q"}.get(item_t)
+        return _TypeInfo(cls, "array", array_module.array, (item_t, typecode))
+
+    np = sys.modules.get("numpy")
+    if np is None:
+        return None
+    npt = sys.modules.get("numpy.typing")
+    if npt is not None and npt.NDArray in (cls, origin):
+        # numpy 2.5 以降の NDArray は `TypeAliasType` で、引数はスカラー型
+        scalar_t = args[0] if args else None
+    elif np.ndarray in (cls, origin):
+        # ndarray[shape, dtype[T]]
+        scalar_args = _ty.get_args(args[1]) if len(args) == 2 else ()
+        scalar_t = scalar_args[0] if scalar_args else None
+    else:
+        return None
+    dtype = None
+    if isinstance(scalar_t, type) and issubclass(scalar_t, np.generic):
+        dtype = np.dtype(scalar_t)
+    item_t = _DTYPE_KIND_TYPES.get(dtype.kind, _ty.Any) if dtype else _ty.Any
+    return _TypeInfo(cls, "array", np.ndarray, (item_t, dtype))
+
+
+def _is_plain_type(typ: type[_ty.Any]) -> bool:
+    # メタクラスが `type` であれば `isinstance` は `type(obj)` の継承関係だけで決まる
+    return type(typ) is type
+
+
+def _all_instances(items: _ty.Iterable, typ: type[_ty.Any]) -> bool:
+    # 要素の型の集合を 1 回の走査で集めてから判定する
+    if all(issubclass(t, typ) for t in set(map(type, items))):
         return True
+    # `__class__` を偽装したオブジェクトも `isinstance` と同じく扱う
+    return all(isinstance(x, typ) for x in items)
+
+
+_Validator = _ty.Callable[[_ty.Any], bool]
+
+
+def _accept(obj) -> bool:
+    return True
+
+
+def _reject(obj) -> bool:
+    return False
+
+
+def _compile_validator(typ: type[_ty.Any]) -> _Validator:
+    if typ is _ty.Any:
+        return _accept
 
     if isinstance(typ, type):
-        return isinstance(obj, typ)
+        return lambda obj: isinstance(obj, typ)
 
     origin = _ty.get_origin(typ)
     args = _ty.get_args(typ)
 
     if origin is _ty.Union:
-        return any(isinstance_generic(obj, arg) for arg in args)
+        alternatives = tuple(_get_validator(arg) for arg in args)
+        return lambda obj: any(validate(obj) for validate in alternatives)
     elif origin is _ty.Literal:
-        return any(obj == arg for arg in args)
+        return lambda obj: any(obj == arg for arg in args)
     elif origin is dict:
+        return _compile_dict_validator(args[0], args[1])
+    elif origin is list or (origin is tuple and len(args) == 2 and args[1] is ...):
+        return _compile_sequence_validator(args[0])
+    elif origin is tuple:
+        return _compile_tuple_validator(args)
+
+    info = _get_type_info(typ)
+    if info.kind == "array":
+        array_t, fmt = info.origin, info.args[1]
+        if fmt is None:
+            return lambda obj: isinstance(obj, array_t)
+        attr = "dtype" if array_t.__module__ == "numpy" else "typecode"
+        return lambda obj: isinstance(obj, array_t) and getattr(obj, attr) == fmt
+
+    return _reject
+
+
+_validators = _TypeCache(_compile_validator)
+_get_validator = _validators.get
+
+
+def _compile_dict_validator(key_t, value_t) -> _Validator:
+    if _is_plain_type(key_t) and _is_plain_type(value_t):
+
+        def validate(obj) -> bool:
+            if not isinstance(obj, dict):
+                return False
+            return _all_instances(obj.keys(), key_t) and _all_instances(
+                obj.values(), value_t
+            )
+
+        return validate
+
+    validate_key = _get_validator(key_t)
+    validate_value = _get_validator(value_t)
+
+    def validate_generic(obj) -> bool:
         if not isinstance(obj, dict):
             return False
-        return all(
-            isinstance_generic(k, args[0]) and isinstance_generic(v, args[1])
-            for k, v in obj.items()
-        )
-    elif origin is list:
+        return all(validate_key(k) and validate_value(v) for k, v in obj.items())
+
+    return validate_generic
+
+
+def _compile_sequence_validator(item_t) -> _Validator:
+    if item_t is _ty.Any:
+        return lambda obj: isinstance(obj, list) or isinstance(obj, tuple)
+
+    if _is_plain_type(item_t):
+
+        def validate(obj) -> bool:
+            if not isinstance(obj, list) and not isinstance(obj, tuple):
+                return False
+            return _all_instances(obj, item_t)
+
+        return validate
+
+    validate_item = _get_validator(item_t)
+
+    def validate_generic(obj) -> bool:
         if not isinstance(obj, list) and not isinstance(obj, tuple):
             return False
-        return all(isinstance_generic(x, args[0]) for x in obj)
-    elif origin is tuple:
+        return all(map(validate_item, obj))
+
+    return validate_generic
+
+
+def _compile_tuple_validator(item_types: tuple) -> _Validator:
+    validators = tuple(_get_validator(t) for t in item_types)
+
+    def validate(obj) -> bool:
         if not isinstance(obj, list) and not isinstance(obj, tuple):
             return False
-        if len(args) == 2 and args[1] is ...:
-            return all(isinstance_generic(x, args[0]) for x in obj)
-        elif len(args) == len(obj):
-            return all(
-                isinstance_generic(x, t) for x, t in zip(obj, args, strict=False)
-            )
+        if len(obj) != len(validators):
+            return False
+        return all(v(x) for x, v in zip(obj, validators, strict=True))
 
-    return False
+    return validate
+
+
+def isinstance_generic(obj, typ: type[_ty.Any]) -> bool:
+    if typ is _ty.Any:
+        return True
+    if isinstance(typ, type):
+        return isinstance(obj, typ)
+    return _get_validator(typ)(obj)
 
 
 def instantiate_generic[T](obj, typ: type[T]) -> T:
@@ -83,8 +330,9 @@ def instantiate_generic[T](obj, typ: type[T]) -> T:
     # `Union` の場合は最初に適合する型でキャスト
     if origin is _ty.Union:
         for t in args:
-            if isinstance_generic(obj, t):
-                return instantiate_generic(obj, t)
+            result = _try_instantiate(obj, t)
+            if result is not _MISMATCH:
+                return result
         raise TypeError(f"Cannot instantiate {obj} as {typ}")
     elif origin is _ty.Literal:
         if any(obj == arg for arg in args):
@@ -112,32 +360,216 @@ def instantiate_generic[T](obj, typ: type[T]) -> T:
     raise TypeError(f"Unsupported type: {typ}")
 
 
-def _concat_keys(left: _ty.Optional[str], right: str) -> str:
-    if left:
-        return f"{left}.{right}"
+# `_try_instantiate` が型に適合しなかったことを表す番兵
+_MISMATCH: _ty.Any = object()
+
+
+def _try_instantiate(obj, typ: type[_ty.Any]):
+    """`isinstance_generic` と `instantiate_generic` を 1 回の走査で行う
+
+    適合する場合は `instantiate_generic(obj, typ)` と同じ値を、適合しない場合は
+    最初の不一致の時点で `_MISMATCH` を返す。
+    """
+    if typ is _ty.Any:
+        return obj
+
+    if isinstance(typ, type):
+        return obj if isinstance(obj, typ) else _MISMATCH
+
+    origin = _ty.get_origin(typ)
+    args = _ty.get_args(typ)
+
+    if origin is _ty.Union:
+        for t in args:
+            result = _try_instantiate(obj, t)
+            if result is not _MISMATCH:
+                return result
+        return _MISMATCH
+    elif origin is _ty.Literal:
+        return obj if any(obj == arg for arg in args) else _MISMATCH
+    elif origin is dict:
+        if not isinstance(obj, dict):
+            return _MISMATCH
+        converted = {}
+        for k, v in obj.items():
+            new_k = _try_instantiate(k, args[0])
+            if new_k is _MISMATCH:
+                return _MISMATCH
+            new_v = _try_instantiate(v, args[1])
+            if new_v is _MISMATCH:
+                return _MISMATCH
+            converted[new_k] = new_v
+        return converted
+    elif origin is list or origin is tuple:
+        if not isinstance(obj, list) and not isinstance(obj, tuple):
+            return _MISMATCH
+        if origin is list or (len(args) == 2 and args[1] is ...):
+            if _is_plain_type(args[0]):
+                if not _all_instances(obj, args[0]):
+                    return _MISMATCH
+                return list(obj) if origin is list else tuple(obj)
+            types: _ty.Iterable = _it.repeat(args[0])
+        elif len(args) == len(obj):
+            types = args
+        else:
+            return _MISMATCH
+        items = []
+        for x, t in zip(obj, types, strict=False):
+            new_x = _try_instantiate(x, t)
+            if new_x is _MISMATCH:
+                return _MISMATCH
+            items.append(new_x)
+        return items if origin is list else tuple(items)
+
+    return _MISMATCH
+
+
+# キーの経路は (親の経路, キー) の組で保持し、エラー時にのみ `a.b.list.c` の形に変換する
+_KeyPath = _ty.Optional[tuple[_ty.Any, str]]
+
+
+def _concat_keys(left: _KeyPath, right: str) -> _KeyPath:
+    return (left, right)
+
+
+def _render_key(key: _ty.Union[_KeyPath, str]) -> _ty.Optional[str]:
+    names = []
+    while isinstance(key, tuple):
+        key, name = key
+        names.append(name)
+    rendered = key
+    for name in reversed(names):
+        rendered = f"{rendered}.{name}" if rendered else name
+    return rendered
+
+
+def _repr_pieces(obj, limit: int, active: set[int]) -> _ty.Iterator[str]:
+    if type(obj) is dict or type(obj) is list or type(obj) is tuple:
+        if id(obj) in active:
+            yield {dict: "{...}", list: "[...]", tuple: "(...)"}[type(obj)]
+            return
+        active.add(id(obj))
+        if type(obj) is dict:
+            yield "{"
+            for i, (k, v) in enumerate(obj.items()):
+                if i:
+                    yield ", "
+                yield from _repr_pieces(k, limit, active)
+                yield ": "
+                yield from _repr_pieces(v, limit, active)
+            yield "}"
+        else:
+            yield "[" if type(obj) is list else "("
+            for i, x in enumerate(obj):
+                if i:
+                    yield ", "
+                yield from _repr_pieces(x, limit, active)
+            if type(obj) is tuple and len(obj) == 1:
+                yield ","
+            yield "]" if type(obj) is list else ")"
+        active.discard(id(obj))
+    elif type(obj) is str and len(obj) > limit:
+        # 引用符の選び方が変わらない場合に限り、先頭部分だけを repr する
+        head = obj[:limit]
+        if ("'" in obj and '"' not in obj) == ("'" in head and '"' not in head):
+            yield repr(head)[:-1]
+        else:
+            yield repr(obj)
     else:
-        return right
+        yield repr(obj)
+
 
+def _bounded_repr(obj, limit: int) -> str:
+    """`repr(obj)` を返す。`limit` 文字を超える場合は先頭 `limit + 1` 文字以上を返す"""
+    pieces = []
+    length = 0
+    for piece in _repr_pieces(obj, limit, set()):
+        pieces.append(piece)
+        length += len(piece)
+        if length > limit:
+            break
+    return "".join(pieces)
 
-def _product_mapping(mapping: dict[str, list]) -> list[dict]:
+
+def _product_mapping(mapping: dict[str, list]) -> _ty.Iterator[dict]:
     keys = mapping.keys()
     values = mapping.values()
-    product = list(_it.product(*values))
-    return [dict(zip(keys, combination, strict=False)) for combination in product]
+    for combination in _it.product(*values):
+        yield dict(zip(keys, combination, strict=False))
+
+
+@_ft.cache
+def _builtin_functions() -> dict[str, type[_ty.Any]]:
+    from . import functional as _func
+
+    return {
+        alternative.__name__: alternative
+        for alternative in _ty.get_args(_func.BuiltinFunction)
+    }
+
+
+def _decode_chunk(
+    ctx: "_ObjToDataclass",
+    typ: type[_ty.Any],
+    template,
+    key: _KeyPath,
+    mapping: dict,
+    chunk: tuple[dict, ...],
+) -> list:
+    decode = _get_decoder(typ)
+    return [decode(ctx, template, key, mapping | new_items) for new_items in chunk]
+
+
+# Placeholder などに依存し、Matrix の組み合わせごとに評価が必要な組み込み関数
+_DEPENDENT = object()
 
 
 @_dc.dataclass
 class _ObjToDataclass:
     filepath: _ty.Optional[Path]
+    lazy_matrix: bool = False
+    workers: int = 1
+    # 複数ドキュメントの YAML を読む場合のドキュメントの番号
+    document: _ty.Optional[int] = None
+    # Wildcard はデコード中、同じディレクトリの内容を読み直さない
+    fs_index: _fsindex.DirectoryIndex = _dc.field(
+        default_factory=_fsindex.DirectoryIndex, repr=False, compare=False
+    )
+    # Placeholder に依存しない組み込み関数の結果 (`id(data)` -> (data, 結果))
+    # data を保持しておくことで id が再利用されないようにする
+    functions: dict[int, tuple[dict, _ty.Any]] = _dc.field(
+        default_factory=dict, repr=False, compare=False
+    )
+    executor: "_ty.Optional[_futures.Executor]" = _dc.field(
+        default=None, repr=False, compare=False
+    )
+    # IncrementalDecoder が前回のデコード結果を引き当てるためのもの
+    incremental: "_ty.Optional[_Incremental]" = _dc.field(
+        default=None, repr=False, compare=False
+    )
+    # `with DecodeProfile():` の中で作られた場合に設定される
+    profile: "_ty.Optional[DecodeProfile]" = _dc.field(
+        default_factory=lambda: _active_profile, repr=False, compare=False
+    )
+
+    def serial(self) -> "_ObjToDataclass":
+        return _dc.replace(self, workers=1, executor=None)
 
-    def run_time_error(self, msg: str, data, key: _ty.Optional[str]) -> RuntimeError:
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def run_time_error(self, msg: str, data, key: _KeyPath) -> RuntimeError:
         filename = str(self.filepath.name) if self.filepath else "<unknown>"
+        if self.document is not None:
+            filename = f"{filename}[{self.document}]"
         if key is not None:
-            line = f"{filename}:{key}: {msg}"
+            line = f"{filename}:{_render_key(key)}: {msg}"
         else:
             line = f"{filename}: {msg}"
 
-        actual = repr(data)
+        actual = _bounded_repr(data, 80)
         if len(actual) > 80:
             line2 = f"actual: {actual[:77]}..."
         else:
@@ -145,208 +577,908 @@ class _ObjToDataclass:
 
         return RuntimeError(f"{line}\n{line2}")
 
-    def dict_get(self, data: dict, keyword: str, key: _ty.Optional[str]):
+    def dict_get(self, data: dict, keyword: str, key: _KeyPath):
         if isinstance(data, dict) and keyword in data:
             return data[keyword]
         else:
             raise self.run_time_error(f"expected to contain {keyword!r}", data, key)
 
-    def get_union(
-        self, cls: type[_T], data, key: _ty.Optional[str], mapping: dict
+    def get_builtin_function(
+        self, data, key: _KeyPath, mapping: dict
+    ) -> "_func.BuiltinFunction":
+        name = data["FUNC"]
+        alternative = _builtin_functions().get(name) if isinstance(name, str) else None
+        if alternative is None:
+            raise self.run_time_error("expected to be a built-in function", data, key)
+        new_key = _concat_keys(key, "ARGS")
+        return _get_decoder(alternative)(self, data.get("ARGS", {}), new_key, mapping)
+
+    def run_matrix(self, cls: type[_T], data: dict, key: _KeyPath, mapping: dict) -> _T:
+        matrix_args = self.dict_get(data, "ARGS", key=key)
+        args_key = _concat_keys(key, "ARGS")
+
+        matrix_mapping = self.dict_get(matrix_args, "mapping", key=args_key)
+        mapping_key = _concat_keys(args_key, "mapping")
+        intermediate_mapping = self.run(
+            dict[str, list],
+            matrix_mapping,
+            key=mapping_key,
+            mapping=mapping,
+        )
+
+        matrix_template = self.dict_get(matrix_args, "template", key=args_key)
+        template_key = _concat_keys(args_key, "template")
+        item_t = _ty.get_args(cls)[0]
+        if self.lazy_matrix and _ty.get_origin(cls) is list:
+            return LazyMatrix(
+                self.serial(),
+                item_t,
+                matrix_template,
+                template_key,
+                mapping,
+                intermediate_mapping,
+            )
+
+        size = _math.prod(len(values) for values in intermediate_mapping.values())
+        if self.workers > 1 and size > 1:
+            result = self.run_matrix_parallel(
+                item_t, matrix_template, template_key, mapping, intermediate_mapping
+            )
+            if result is not None:
+                return instantiate_generic(result, cls)
+
+        decode = _get_decoder(item_t)
+        result = [
+            decode(self, matrix_template, template_key, mapping | new_items)
+            for new_items in _product_mapping(intermediate_mapping)
+        ]
+        return instantiate_generic(result, cls)
+
+    def run_matrix_parallel(
+        self,
+        typ: type[_ty.Any],
+        template,
+        key: _KeyPath,
+        mapping: dict,
+        axes: dict[str, list],
+    ) -> _ty.Optional[list]:
+        import concurrent.futures as _futures
+        import multiprocessing as _mp
+        import pickle as _pickle
+
+        # ワーカーでは入れ子の Matrix を逐次的にデコードする
+        # ワーカーでの処理時間は Matrix 全体の時間として記録される
+        ctx = _dc.replace(self.serial(), functions={}, incremental=None, profile=None)
+        try:
+            _pickle.dumps((ctx, typ, template, mapping, axes))
+        except (_pickle.PicklingError, AttributeError, TypeError):
+            # ローカルに定義された型などはプロセス間で受け渡せないため逐次処理に戻す
+            return None
+
+        if self.executor is None:
+            # スレッドを含むプロセスでの fork は安全でないため forkserver を優先する
+            methods = _mp.get_all_start_methods()
+            method = "forkserver" if "forkserver" in methods else "spawn"
+            self.executor = _futures.ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=_mp.get_context(method)
+            )
+        size = _math.prod(len(values) for values in axes.values())
+        chunksize = max(1, -(-size // (self.workers * 4)))
+        chunks = _it.batched(_product_mapping(axes), chunksize)
+        results = self.executor.map(
+            _decode_chunk,
+            _it.repeat(ctx),
+            _it.repeat(typ),
+            _it.repeat(template),
+            _it.repeat(key),
+            _it.repeat(mapping),
+            chunks,
+        )
+        return [item for chunk in results for item in chunk]
+
+    def run_function(
+        self, cls: type[_T], data: dict, key: _KeyPath, mapping: dict
     ) -> _T:
-        for alternative in _ty.get_args(cls):
-            if alternative.__name__ == data["TYPE"]:
-                new_key = _concat_keys(key, "ARGS")
-                return self.run(
-                    alternative, data.get("ARGS", {}), key=new_key, mapping=mapping
-                )
-        raise self.run_time_error(f"expected to be {cls}", data, key)
+        if self.profile is None and self.incremental is None:
+            return self._run_function(cls, data, key, mapping)
+        run = _ObjToDataclass._run_function
+        return self.run_hooked(run, cls, data, key, mapping)
 
-    def get_builtin_function(
-        self, data, key: _ty.Optional[str], mapping: dict
-    ) -> _func.BuiltinFunction:
-        for alternative in _ty.get_args(_func.BuiltinFunction):
-            if data["FUNC"] == alternative.__name__:
-                new_key = _concat_keys(key, "ARGS")
-                return self.run(
-                    alternative, data.get("ARGS", {}), key=new_key, mapping=mapping
-                )
-        raise self.run_time_error("expected to be a built-in function", data, key)
+    def run_hooked(
+        self, run: "_HookedRun", cls: type[_T], data, key: _KeyPath, mapping: dict
+    ) -> _T:
+        """プロファイラや IncrementalDecoder を有効にした場合に `run` を呼ぶ"""
+        if self.profile is not None:
+            return self.profile.measure(self._reuse, run, cls, data, key, mapping)
+        return self._reuse(run, cls, data, key, mapping)
+
+    def _reuse(
+        self, run: "_HookedRun", cls: type[_T], data, key: _KeyPath, mapping: dict
+    ) -> _T:
+        if self.incremental is not None and not mapping:
+            return self.incremental.reuse(self, run, cls, data, key)
+        return run(self, cls, data, key, mapping)
+
+    def _run_function(
+        self, cls: type[_T], data: dict, key: _KeyPath, mapping: dict
+    ) -> _T:
+        if data["FUNC"] == "Matrix":
+            return self.run_matrix(cls, data, key=key, mapping=mapping)
+
+        entry = self.functions.get(id(data))
+        if entry is None:
+            result = self.eval_function(data, key=key, mapping=mapping)
+            # Matrix の組み合わせごとに同じ結果になるものは一度だけ評価する
+            if not _uses_function(data, "Placeholder", "Matrix"):
+                self.functions[id(data)] = (data, result)
+            else:
+                self.functions[id(data)] = (data, _DEPENDENT)
+        elif entry[1] is _DEPENDENT:
+            result = self.eval_function(data, key=key, mapping=mapping)
+        else:
+            result = entry[1]
+            if isinstance(result, list):
+                result = list(result)
+
+        return instantiate_generic(result, cls)
+
+    def eval_function(self, data: dict, key: _KeyPath, mapping: dict):
+        from . import functional as _func
+
+        func = self.get_builtin_function(data, key=key, mapping=mapping)
+
+        match func:
+            case _func.FilePath():
+                result = str(self.filepath) if self.filepath else "<unknown>"
+            case _func.FileName():
+                result = self.filepath.name if self.filepath else "<unknown>"
+            case _func.FileDir():
+                if self.filepath:
+                    result = _func.path_to_str(self.filepath.parent)
+                else:
+                    result = "<unknown>"
+            case _func.FileFmt():
+                if self.filepath:
+                    from string import Template
+
+                    temp = Template(func.fmt)
+                    # ${parent}/${stem}${suffix}
+                    result = temp.substitute(
+                        parent=str(self.filepath.parent),
+                        stem=self.filepath.stem,
+                        suffix=self.filepath.suffix,
+                    )
+                else:
+                    result = "<unknown>"
+            case _func.Wildcard():
+                result = func.run(self.fs_index)
+            case _func.Placeholder():
+                if func.key not in mapping:
+                    raise self.run_time_error(
+                        f"Matrix.mapping should contain {func.key!r}", mapping, key
+                    )
+                result = mapping[func.key]
+            case _:
+                result = func.run()
+
+        return result
 
     def run(
         self,
         cls: type[_T],
         data,
-        key: _ty.Optional[str] = None,
+        key: _KeyPath = None,
         mapping: _ty.Optional[dict] = None,
     ) -> _T:
         if mapping is None:
             mapping = {}
+        return _get_decoder(cls)(self, data, key, mapping)
+
+
+# 型ごとにコンパイルしたデコーダ: (ctx, data, key, mapping) -> 変換後の値
+_Decoder = _ty.Callable[[_ObjToDataclass, _ty.Any, _KeyPath, dict], _ty.Any]
+
+# データクラスや組み込み関数のデコード: (ctx, cls, data, key, mapping) -> 変換後の値
+_HookedRun = _ty.Callable[
+    [_ObjToDataclass, type[_ty.Any], _ty.Any, _KeyPath, dict], _ty.Any
+]
+
+
+def _compile_decoder(cls: type[_ty.Any]) -> _Decoder:
+    info = _get_type_info(cls)
+    if info.kind == "dataclass":
+        return _compile_dataclass(info)
+
+    match info.kind:
+        case "optional":
+            decode = _compile_optional(cls)
+        case "union":
+            decode = _compile_union(cls)
+        case "literal":
+            decode = _compile_literal(cls)
+        case "list":
+            decode = _compile_list(cls, info.args[0])
+        case "dict":
+            key_t, value_t = info.args
+            decode = _compile_dict(cls, key_t, value_t)
+        case "array":
+            decode = _compile_array(info)
+        case "any":
+            decode = _decode_any
+        case _:
+            decode = _compile_constructor(cls)
+    return decode
+
+
+_decoders = _TypeCache(_compile_decoder)
+_get_decoder = _decoders.get
+
+
+def _compile_dataclass(info: _TypeInfo) -> _Decoder:
+    cls = info.typ
+    field_decoders: dict[str, _Decoder] = {}
+
+    def decode(ctx: _ObjToDataclass, data, key, mapping):
+        if not isinstance(data, dict):
+            raise ctx.run_time_error("expected to be dict", data, key)
+        if "FUNC" in data:
+            return ctx.run_function(cls, data, key, mapping)
+        if ctx.profile is None and ctx.incremental is None:
+            return construct(ctx, cls, data, key, mapping)
+        return ctx.run_hooked(construct, cls, data, key, mapping)
+
+    def construct(ctx: _ObjToDataclass, cls, data, key, mapping):
+        cls_args = {
+            k: field_decoders[k](ctx, v, _concat_keys(key, k), mapping)
+            for k, v in data.items()
+        }
+        return cls(**cls_args)
+
+    with _decoders.registering(cls, decode):
+        for f in info.fields:
+            field_decoders[f.name] = _get_decoder(f.type)
+    return decode
+
 
+def _compile_optional(cls) -> _Decoder:
+    decode_value = _get_decoder(_ty.get_args(cls)[0])
+
+    def decode(ctx: _ObjToDataclass, data, key, mapping):
         if isinstance(data, dict) and "FUNC" in data:
-            if data["FUNC"] == "Matrix":
-                matrix_args = self.dict_get(data, "ARGS", key=key)
-                args_key = _concat_keys(key, "ARGS")
-
-                matrix_mapping = self.dict_get(matrix_args, "mapping", key=args_key)
-                mapping_key = _concat_keys(args_key, "mapping")
-                intermediate_mapping = self.run(
-                    dict[str, list],
-                    matrix_mapping,
-                    key=mapping_key,
-                    mapping=mapping,
-                )
-                mappings = _product_mapping(intermediate_mapping)
-
-                matrix_template = self.dict_get(matrix_args, "template", key=args_key)
-                template_key = _concat_keys(args_key, "template")
-                result = [
-                    self.run(
-                        _ty.get_args(cls)[0],
-                        matrix_template,
-                        key=template_key,
-                        mapping=mapping | new_items,
-                    )
-                    for new_items in mappings
-                ]
-                return instantiate_generic(result, cls)
+            return ctx.run_function(cls, data, key, mapping)
+        if data is None:
+            return None
+        return decode_value(ctx, data, _concat_keys(key, "Optional"), mapping)
+
+    return decode
+
+
+def _compile_union(cls) -> _Decoder:
+    alternatives = _ty.get_args(cls)
+    alternative_decoders = [(alt, _get_decoder(alt)) for alt in alternatives]
+
+    def decode(ctx: _ObjToDataclass, data, key, mapping):
+        if isinstance(data, dict):
+            if "FUNC" in data:
+                return ctx.run_function(cls, data, key, mapping)
+            if "TYPE" in data:
+                for alternative, decode_alternative in alternative_decoders:
+                    if alternative.__name__ == data["TYPE"]:
+                        new_key = _concat_keys(key, "ARGS")
+                        args = data.get("ARGS", {})
+                        return decode_alternative(ctx, args, new_key, mapping)
+                raise ctx.run_time_error(f"expected to be {cls}", data, key)
+        for t in alternatives:
+            result = _try_instantiate(data, t)
+            if result is not _MISMATCH:
+                return result
+        raise ctx.run_time_error(
+            f"expected to contain {'TYPE'!r} or be {cls}", data, key
+        )
 
-            func = self.get_builtin_function(data, key=key, mapping=mapping)
-
-            match func:
-                case _func.FilePath():
-                    result = str(self.filepath) if self.filepath else "<unknown>"
-                case _func.FileName():
-                    result = self.filepath.name if self.filepath else "<unknown>"
-                case _func.FileDir():
-                    if self.filepath:
-                        result = _func.path_to_str(self.filepath.parent)
-                    else:
-                        result = "<unknown>"
-                case _func.FileFmt():
-                    if self.filepath:
-                        temp = Template(func.fmt)
-                        # ${parent}/${stem}${suffix}
-                        result = temp.substitute(
-                            parent=str(self.filepath.parent),
-                            stem=self.filepath.stem,
-                            suffix=self.filepath.suffix,
-                        )
-                    else:
-                        result = "<unknown>"
-                case _func.Placeholder():
-                    if func.key not in mapping:
-                        raise self.run_time_error(
-                            f"Matrix.mapping should contain {func.key!r}", mapping, key
-                        )
-                    result = mapping[func.key]
-                case _:
-                    result = func.run()
-
-            return instantiate_generic(result, cls)
-
-        if _dc.is_dataclass(cls):
-            if not isinstance(data, dict):
-                raise self.run_time_error("expected to be dict", data, key)
-            field_types = {f.name: f.type for f in _dc.fields(cls)}
-            cls_args = {
-                k: self.run(
-                    field_types[k], v, key=_concat_keys(key, k), mapping=mapping
-                )
-                for k, v in data.items()
-            }
-            return cls(**cls_args)
-
-        if _is_optional(cls):
-            if data is not None:
-                new_key = _concat_keys(key, "Optional")
-                return self.run(
-                    _ty.get_args(cls)[0], data, key=new_key, mapping=mapping
-                )
-            else:
-                return None
-
-        if _ty.get_origin(cls) is _ty.Union:
-            if isinstance(data, dict) and "TYPE" in data:
-                return self.get_union(cls, data, key=key, mapping=mapping)
-            for t in _ty.get_args(cls):
-                if isinstance_generic(data, t):
-                    return instantiate_generic(data, t)
-            raise self.run_time_error(
-                f"expected to contain {'TYPE'!r} or be {cls}", data, key
-            )
+    return decode
 
-        if _ty.get_origin(cls) is _ty.Literal:
-            alternatives = _ty.get_args(cls)
-            if any(data == alt for alt in alternatives):
-                return data
-            else:
-                raise self.run_time_error(
-                    f"expected to be one of {alternatives}", data, key
-                )
-
-        if _ty.get_origin(cls) is list:
-            if not isinstance(data, list):
-                raise self.run_time_error("expected to be list", data, key)
-            new_key = _concat_keys(key, "list")
-            return [
-                self.run(_ty.get_args(cls)[0], item, key=new_key, mapping=mapping)
-                for item in data
-            ]
-
-        if cls is list:
-            if not isinstance(data, list):
-                raise self.run_time_error("expected to be list", data, key)
-            new_key = _concat_keys(key, "list")
-            return [
-                self.run(_ty.Any, item, key=new_key, mapping=mapping) for item in data
-            ]
-
-        if _ty.get_origin(cls) is dict:
-            if not isinstance(data, dict):
-                raise self.run_time_error("expected to be dict", data, key)
-            new_key = _concat_keys(key, "dict")
-            return {
-                self.run(
-                    _ty.get_args(cls)[0], k, key=new_key, mapping=mapping
-                ): self.run(_ty.get_args(cls)[1], v, key=new_key, mapping=mapping)
-                for k, v in data.items()
-            }
 
-        if cls is dict:
-            if not isinstance(data, dict):
-                raise self.run_time_error("expected to be dict", data, key)
-            new_key = _concat_keys(key, "dict")
-            return {
-                self.run(_ty.Any, k, key=new_key, mapping=mapping): self.run(
-                    _ty.Any, v, key=new_key, mapping=mapping
-                )
-                for k, v in data.items()
-            }
+def _compile_literal(cls) -> _Decoder:
+    alternatives = _ty.get_args(cls)
+
+    def decode(ctx: _ObjToDataclass, data, key, mapping):
+        if isinstance(data, dict) and "FUNC" in data:
+            return ctx.run_function(cls, data, key, mapping)
+        if any(data == alt for alt in alternatives):
+            return data
+        raise ctx.run_time_error(f"expected to be one of {alternatives}", data, key)
+
+    return decode
 
-        if cls is _ty.Any:
-            return self.run(type(data), data, key=key, mapping=mapping)
 
+def _compile_list(cls, item_t) -> _Decoder:
+    decode_item = _get_decoder(item_t)
+
+    def decode(ctx: _ObjToDataclass, data, key, mapping):
+        if isinstance(data, dict) and "FUNC" in data:
+            return ctx.run_function(cls, data, key, mapping)
+        if not isinstance(data, list):
+            raise ctx.run_time_error("expected to be list", data, key)
+        new_key = _concat_keys(key, "list")
+        return [decode_item(ctx, item, new_key, mapping) for item in data]
+
+    return decode
+
+
+def _compile_dict(cls, key_t, value_t) -> _Decoder:
+    decode_key = _get_decoder(key_t)
+    decode_value = _get_decoder(value_t)
+
+    def decode(ctx: _ObjToDataclass, data, key, mapping):
+        if not isinstance(data, dict):
+            raise ctx.run_time_error("expected to be dict", data, key)
+        if "FUNC" in data:
+            return ctx.run_function(cls, data, key, mapping)
+        new_key = _concat_keys(key, "dict")
+        return {
+            decode_key(ctx, k, new_key, mapping): decode_value(ctx, v, new_key, mapping)
+            for k, v in data.items()
+        }
+
+    return decode
+
+
+# 配列に一括で変換できる要素の型
+_ARRAY_ITEM_TYPES: dict[_ty.Any, frozenset[type]] = {
+    bool: frozenset({bool}),
+    int: frozenset({int}),
+    float: frozenset({int, float}),
+    complex: frozenset({int, float, complex}),
+    _ty.Any: frozenset({int, float, complex}),
+}
+
+
+def _element_types(data: list, nested: bool) -> set[type]:
+    types = set(map(type, data))
+    # 多次元の場合は最も内側の要素の型を調べる
+    while nested and types == {list}:
+        data = list(_it.chain.from_iterable(data))
+        types = set(map(type, data))
+    return types
+
+
+def _compile_array(info: _TypeInfo) -> _Decoder:
+    cls = info.typ
+    item_t, fmt = info.args
+    if info.origin.__module__ == "numpy":
+        np = sys.modules["numpy"]
+        nested = True
+
+        def pack(items: list):
+            return np.array(items, dtype=fmt)
+
+    else:
+        if fmt is None:
+            raise TypeError(f"Unsupported type: {cls} (use array.array[float | int])")
+        nested = False
+
+        def pack(items: list):
+            return info.origin(fmt, items)
+
+    allowed = _ARRAY_ITEM_TYPES[item_t]
+    decode_item = _get_decoder(item_t)
+
+    def decode_items(ctx: _ObjToDataclass, data, key, mapping) -> list:
+        if not isinstance(data, list):
+            raise ctx.run_time_error("expected to be list", data, key)
+        new_key = _concat_keys(key, "list")
+        return [
+            decode_items(ctx, item, new_key, mapping)
+            if nested and isinstance(item, list)
+            else decode_item(ctx, item, new_key, mapping)
+            for item in data
+        ]
+
+    def decode(ctx: _ObjToDataclass, data, key, mapping):
+        if isinstance(data, dict) and "FUNC" in data:
+            data = ctx.run_function(list[_ty.Any], data, key, mapping)
+        if not isinstance(data, list):
+            raise ctx.run_time_error("expected to be list", data, key)
+        # 要素の型を一度だけ調べ、一括で変換できない場合は list と同じく
+        # 要素ごとに変換する (不正な値のエラーも list の場合と同じになる)
+        if not _element_types(data, nested) <= allowed:
+            data = decode_items(ctx, data, key, mapping)
+        try:
+            return pack(data)
+        except (OverflowError, ValueError) as e:
+            raise ctx.run_time_error(f"cannot convert to {cls}: {e}", data, key) from e
+
+    return decode
+
+
+def _decode_any(ctx: _ObjToDataclass, data, key, mapping):
+    if isinstance(data, dict) and "FUNC" in data:
+        return ctx.run_function(_ty.Any, data, key, mapping)
+    return _get_decoder(type(data))(ctx, data, key, mapping)
+
+
+def _compile_constructor(cls) -> _Decoder:
+    def decode(ctx: _ObjToDataclass, data, key, mapping):
+        if isinstance(data, dict) and "FUNC" in data:
+            return ctx.run_function(cls, data, key, mapping)
         return cls(data)
 
+    return decode
 
-def obj_to_dataclass[T](cls: type[T], data, filepath: _ty.Optional[Path] = None) -> T:
-    return _ObjToDataclass(filepath).run(cls, data)
 
+class LazyMatrix[T](_abc.Sequence[T]):
+    """Matrix の各組み合わせを、アクセスされた時点でデコードするシーケンス
 
-class _YAMLDumper(_yaml.SafeDumper):
-    pass
+    `obj_to_dataclass(..., lazy_matrix=True)` の場合に `list[T]` の代わりに返される。
+    テンプレートのエラーは該当する要素にアクセスした時点で送出される。
+    """
 
+    def __init__(
+        self,
+        ctx: _ObjToDataclass,
+        typ: type[T],
+        template,
+        key: _KeyPath,
+        mapping: dict,
+        axes: dict[str, list],
+        indices: _ty.Optional[range] = None,
+    ) -> None:
+        self._ctx = ctx
+        self._typ = typ
+        self._decode = _get_decoder(typ)
+        self._template = template
+        self._key = key
+        self._mapping = mapping
+        self._axes = axes
+        self._size = _math.prod(len(values) for values in axes.values())
+        self._indices = range(self._size) if indices is None else indices
+
+    def _instantiate(self, new_items: dict) -> T:
+        mapping = self._mapping | new_items
+        item = self._decode(self._ctx, self._template, self._key, mapping)
+        return instantiate_generic(item, self._typ)
+
+    def _combination(self, index: int) -> dict:
+        # itertools.product と同じ順序になるよう、末尾の軸から位置を求める
+        positions = []
+        for values in reversed(self._axes.values()):
+            index, position = divmod(index, len(values))
+            positions.append(values[position])
+        return dict(zip(self._axes.keys(), reversed(positions), strict=True))
+
+    def __len__(self) -> int:
+        return len(self._indices)
+
+    @_ty.overload
+    def __getitem__(self, index: int) -> T: ...
+
+    @_ty.overload
+    def __getitem__(self, index: slice) -> "LazyMatrix[T]": ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return LazyMatrix(
+                self._ctx,
+                self._typ,
+                self._template,
+                self._key,
+                self._mapping,
+                self._axes,
+                indices=self._indices[index],
+            )
+        return self._instantiate(self._combination(self._indices[index]))
 
-class _BlockScalarStr(str):
-    pass
+    def __iter__(self) -> _ty.Iterator[T]:
+        if self._indices == range(self._size):
+            for new_items in _product_mapping(self._axes):
+                yield self._instantiate(new_items)
+        else:
+            for index in self._indices:
+                yield self._instantiate(self._combination(index))
+
+    def __repr__(self) -> str:
+        return f"LazyMatrix(typ={self._typ!r}, len={len(self)})"
+
+
+def obj_to_dataclass[T](
+    cls: type[T],
+    data,
+    filepath: _ty.Optional[Path] = None,
+    *,
+    lazy_matrix: bool = False,
+    workers: int = 1,
+    fs_index: _ty.Optional[_fsindex.DirectoryIndex] = None,
+) -> T:
+    """`data` を `cls` に変換する
+
+    `fs_index` を渡すと Wildcard はその内容を使ってパスを列挙する。
+    省略した場合はデコードごとに新しく作る。
+    """
+    ctx = _ObjToDataclass(
+        filepath,
+        lazy_matrix=lazy_matrix,
+        workers=workers,
+        fs_index=fs_index or _fsindex.DirectoryIndex(),
+    )
+    try:
+        return ctx.run(cls, data)
+    finally:
+        ctx.shutdown()
+
+
+def iter_obj_to_dataclass[T](
+    cls: type[T],
+    stream: _ty.Union[str, bytes, _ty.IO],
+    filepath: _ty.Optional[Path] = None,
+    *,
+    lazy_matrix: bool = False,
+    workers: int = 1,
+    fs_index: _ty.Optional[_fsindex.DirectoryIndex] = None,
+) -> _ty.Iterator[T]:
+    """`---` で区切られた YAML の各ドキュメントを順にデコードする
+
+    ドキュメントは 1 つずつ読み込まれるため、メモリ使用量は最大のドキュメントの
+    大きさで抑えられる。エラーの位置には `file.yaml[3]` のようにドキュメントの
+    番号 (0 始まり) が付く。
+    """
+    from . import _yamlio
+
+    ctx = _ObjToDataclass(
+        filepath,
+        lazy_matrix=lazy_matrix,
+        workers=workers,
+        fs_index=fs_index or _fsindex.DirectoryIndex(),
+    )
+    try:
+        for index, data in enumerate(_yamlio.load_all(stream)):
+            ctx.document = index
+            ctx.functions = {}
+            yield ctx.run(cls, data)
+    finally:
+        ctx.shutdown()
+
+
+# コンテナの `id` -> (構造のハッシュ, Wildcard を含むか)
+_NodeHashes = dict[int, tuple[int, bool]]
+
+
+def _structural_hashes(data) -> _NodeHashes:
+    hashes: _NodeHashes = {}
+
+    def visit(node) -> tuple[int, bool]:
+        found = hashes.get(id(node))
+        if found is not None:
+            return found
+        volatile = False
+        items = []
+        if type(node) is dict:
+            volatile = node.get("FUNC") == "Wildcard"
+            for k, v in node.items():
+                # 多くを占める文字列は関数を呼ばずにハッシュする
+                kh = hash((str, k)) if type(k) is str else _scalar_hash(k)
+                tv = type(v)
+                if tv is dict or tv is list:
+                    h, v_volatile = visit(v)
+                    volatile = volatile or v_volatile
+                elif tv is str:
+                    h = hash((str, v))
+                else:
+                    h = _scalar_hash(v)
+                items.append((kh, h))
+        else:
+            for v in node:
+                tv = type(v)
+                if tv is dict or tv is list:
+                    h, v_volatile = visit(v)
+                    volatile = volatile or v_volatile
+                elif tv is str:
+                    h = hash((str, v))
+                else:
+                    h = _scalar_hash(v)
+                items.append(h)
+        result = hashes[id(node)] = (hash((type(node), tuple(items))), volatile)
+        return result
+
+    if type(data) is dict or type(data) is list:
+        visit(data)
+    return hashes
+
+
+def _scalar_hash(value) -> int:
+    t = type(value)
+    # `1 == 1.0 == True` や `0.0 == -0.0` を区別する
+    if t is float:
+        return hash((t, repr(value)))
+    try:
+        return hash((t, value))
+    except TypeError:
+        return hash((t, repr(value)))
+
+
+def _node_hash(node, hashes: _NodeHashes) -> int:
+    if type(node) is dict or type(node) is list:
+        return hashes[id(node)][0]
+    return _scalar_hash(node)
+
+
+def _changed_paths(
+    old, old_hashes: _NodeHashes, new, new_hashes: _NodeHashes
+) -> list[tuple]:
+    changed: list[tuple] = []
+
+    def visit(old, new, path: tuple) -> None:
+        if _node_hash(old, old_hashes) == _node_hash(new, new_hashes):
+            return
+        start = len(changed)
+        if type(old) is dict and type(new) is dict:
+            for k, v in new.items():
+                if k in old:
+                    visit(old[k], v, (*path, k))
+                else:
+                    changed.append((*path, k))
+            changed.extend((*path, k) for k in old if k not in new)
+        elif type(old) is list and type(new) is list and len(old) == len(new):
+            for i, (old_item, new_item) in enumerate(zip(old, new, strict=True)):
+                visit(old_item, new_item, (*path, i))
+        # 要素の順序だけが変わった場合などはコンテナ自体を変更とする
+        if len(changed) == start:
+            changed.append(path)
+
+    visit(old, new, ())
+    return changed
+
+
+# デコード結果の記録: (結果, その中でデコードした部分木の [(エントリ, 記録)])
+_Record = tuple[_ty.Any, list]
+
+
+class _Incremental:
+    """前回のデコードで得たデータクラスと組み込み関数の結果を引き当てる
+
+    (キーのパス, 型, 構造のハッシュ) をエントリとして結果を記録する。リストの
+    要素などは同じエントリになり得るため、1 つの結果が複数の箇所で共有されない
+    よう、引き当てた記録とその部分木の記録は使用済みにする。
+    """
+
+    def __init__(self, hashes: _NodeHashes, previous: dict[tuple, list[_Record]]):
+        self.hashes = hashes
+        self.previous = previous
+        self.current: dict[tuple, list[_Record]] = {}
+        self.reused = 0
+        self._claimed: set[int] = set()
+        # デコード中の部分木の記録を集めるリスト
+        self._frames: list[list] = [[]]
+
+    def reuse(
+        self,
+        ctx: _ObjToDataclass,
+        run: _HookedRun,
+        cls: type[_ty.Any],
+        data,
+        key: _KeyPath,
+    ):
+        node = self.hashes.get(id(data))
+        # Wildcard の結果はファイルシステムに依存するため毎回評価する
+        if node is None or node[1]:
+            return run(ctx, cls, data, key, {})
+        entry = (key, _type_key(cls), node[0])
+        try:
+            record = self._claim(entry)
+        except TypeError:
+            return run(ctx, cls, data, key, {})
+
+        if record is None:
+            self._frames.append([])
+            try:
+                result = run(ctx, cls, data, key, {})
+            finally:
+                children = self._frames.pop()
+            record = (result, children)
+        else:
+            self.reused += 1
+            self._keep(record)
+        self.current.setdefault(entry, []).append(record)
+        self._frames[-1].append((entry, record))
+        return record[0]
+
+    def _claim(self, entry: tuple) -> _ty.Optional[_Record]:
+        records = self.previous.get(entry)
+        while records:
+            record = records.pop()
+            if not record[1]:
+                if id(record) in self._claimed:
+                    continue
+                self._claimed.add(id(record))
+                return record
+            # 部分木の結果をすでに別の箇所で使っている場合は再利用しない
+            if all(id(r) not in self._claimed for r in self._walk(record)):
+                self._claimed.update(id(r) for r in self._walk(record))
+                return record
+        return None
+
+    def _keep(self, record: _Record) -> None:
+        for entry, child in record[1]:
+            self.current.setdefault(entry, []).append(child)
+            self._keep(child)
+
+    def _walk(self, record: _Record) -> _ty.Iterator[_Record]:
+        stack = [record]
+        while stack:
+            record = stack.pop()
+            yield record
+            stack.extend(child for _, child in record[1])
+
+
+class IncrementalDecoder[T]:
+    """設定の再読み込みのたびに、前回から変わっていない部分のデコード結果を再利用する
+
+    前回の YAML のツリーとデコード結果を保持し、新しいツリーと構造のハッシュで
+    比較する。変わっていないデータクラスや組み込み関数 (Matrix を含む) の
+    部分木は前回のオブジェクトをそのまま返し、変わった部分木だけをデコードする。
+    Wildcard を含む部分木は毎回評価する。
+
+    `decode` には毎回新しく読み込んだツリーを渡すこと。再利用されるオブジェクトは
+    前回の結果と同一のため、呼び出し側で変更しないこと。
+    """
+
+    def __init__(
+        self,
+        cls: type[T],
+        filepath: _ty.Optional[Path] = None,
+        *,
+        workers: int = 1,
+        fs_index: _ty.Optional[_fsindex.DirectoryIndex] = None,
+    ) -> None:
+        self.cls = cls
+        self.filepath = filepath
+        self.workers = workers
+        self.fs_index = fs_index
+        # 前回のデコードから変わったパス (最初のデコードでは `[()]`)
+        self.changed_paths: list[tuple] = []
+        # 前回のデコードで再利用した部分木の数
+        self.reused = 0
+        self._data: _ty.Any = None
+        self._hashes: _ty.Optional[_NodeHashes] = None
+        self._results: dict[tuple, list[_Record]] = {}
+
+    def decode(self, data) -> T:
+        """`data` をデコードし、`changed_paths` を更新する
+
+        パスは YAML のキーとリストの添字のタプル (例: `("rules", 3, "command")`)。
+        """
+        hashes = _structural_hashes(data)
+        if self._hashes is not None:
+            changed = _changed_paths(self._data, self._hashes, data, hashes)
+        else:
+            changed = [()]
+        incremental = _Incremental(hashes, self._results)
+        ctx = _ObjToDataclass(
+            self.filepath,
+            workers=self.workers,
+            fs_index=self.fs_index or _fsindex.DirectoryIndex(),
+            incremental=incremental,
+        )
+        try:
+            result = ctx.run(self.cls, data)
+        finally:
+            ctx.shutdown()
 
+        # 次回は同じエントリの記録を出現順に引き当てるため、末尾から取り出せるようにする
+        for records in incremental.current.values():
+            records.reverse()
+        self._data = data
+        self._hashes = hashes
+        self._results = incremental.current
+        self.changed_paths = changed
+        self.reused = incremental.reused
+        return result
 
-def _block_scalar_representer(dumper, data):
-    return dumper.represent_scalar("tag:yaml.org,2002:str", data, style="|")
+    def load(self, stream: _ty.Union[str, bytes, _ty.IO]) -> T:
+        """YAML を読み込んで `decode` する"""
+        from . import _yamlio
 
+        return self.decode(_yamlio.load(stream))
 
-_yaml.add_representer(_BlockScalarStr, _block_scalar_representer, Dumper=_YAMLDumper)
+
+@_dc.dataclass
+class _ProfileEntry:
+    calls: int = 0
+    cumulative: float = 0.0
+    self_time: float = 0.0
+    blocks: int = 0
+
+
+# `with DecodeProfile():` で有効になっているプロファイラ
+_active_profile: "_ty.Optional[DecodeProfile]" = None
+
+
+class DecodeProfile:
+    """デコードにかかった時間を、型とキーのパスごとに集計する
+
+    `with` の中で行った `obj_to_dataclass` などのデコードについて、データクラスと
+    組み込み関数 (Matrix を含む) ごとに呼び出し回数、累積時間、自身の時間、
+    確保したメモリブロックの増分 (`sys.getallocatedblocks`) を記録する。
+    並列に展開した Matrix の要素は Matrix 全体の時間に含まれる。
+
+    >>> with DecodeProfile() as profile:
+    ...     config = obj_to_dataclass(Config, data)
+    >>> profile.dump("profile.json")
+    """
+
+    def __init__(self) -> None:
+        self.entries: dict[tuple, _ProfileEntry] = {}
+        # 計測中の呼び出しごとの、子の呼び出しにかかった時間
+        self._children: list[float] = []
+        self._previous: _ty.Optional[DecodeProfile] = None
+
+    def __enter__(self) -> "DecodeProfile":
+        global _active_profile
+        self._previous = _active_profile
+        _active_profile = self
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        global _active_profile
+        _active_profile = self._previous
+
+    def measure(self, run: _ty.Callable[..., _T], *args) -> _T:
+        """`run(*args)` を計測する。`args` は `(run, cls, data, key, mapping)`"""
+        from time import perf_counter
+
+        _, cls, data, key, _ = args
+        function = data.get("FUNC") if isinstance(data, dict) else None
+        try:
+            entry_key = (key, _type_key(cls), function)
+            entry = self.entries.get(entry_key)
+        except TypeError:
+            entry_key = (key, repr(cls), function)
+            entry = self.entries.get(entry_key)
+        if entry is None:
+            entry = self.entries[entry_key] = _ProfileEntry()
+
+        self._children.append(0.0)
+        blocks = sys.getallocatedblocks()
+        start = perf_counter()
+        try:
+            return run(*args)
+        finally:
+            elapsed = perf_counter() - start
+            entry.blocks += sys.getallocatedblocks() - blocks
+            children = self._children.pop()
+            if self._children:
+                self._children[-1] += elapsed
+            entry.calls += 1
+            entry.cumulative += elapsed
+            entry.self_time += elapsed - children
+
+    def report(self, limit: _ty.Optional[int] = None) -> list[dict[str, _ty.Any]]:
+        """累積時間の長い順に並べた集計結果"""
+        rows = []
+        for (key, typ, function), entry in self.entries.items():
+            if isinstance(typ, tuple):
+                typ = typ[1]
+            rows.append(
+                {
+                    "path": _render_key(key) or "<root>",
+                    "type": typ.__qualname__ if isinstance(typ, type) else str(typ),
+                    "function": function,
+                    "calls": entry.calls,
+                    "cumulative": entry.cumulative,
+                    "self": entry.self_time,
+                    "blocks": entry.blocks,
+                }
+            )
+        rows.sort(key=lambda row: (-row["cumulative"], -row["self"]))
+        return rows[:limit]
+
+    def dump(self, path: _ty.Union[str, Path], limit: _ty.Optional[int] = None):
+        """`report` を JSON として書き出す"""
+        import json
+
+        with open(path, "w") as f:
+            json.dump(self.report(limit), f, indent=2)
+            f.write("\n")
 
 
 def _get_field_default(field: _dc.Field) -> _ty.Any:
@@ -357,13 +1489,13 @@ def _get_field_default(field: _dc.Field) -> _ty.Any:
         return field.default_factory()
 
     # デフォルトがない場合
-    return dataclass_to_obj(field.type)
+    return _get_example(field.type)
 
 
 def _get_alternatives(cls: type[_ty.Any]) -> list[dict]:
     alternatives = []
-    for alternative in _ty.get_args(cls):
-        arguments = dataclass_to_obj(alternative)
+    for alternative in _get_type_info(cls).args:
+        arguments = _get_example(alternative)
         if isinstance(arguments, dict) and not arguments:
             obj = {"TYPE": alternative.__name__}
         else:
@@ -372,94 +1504,377 @@ def _get_alternatives(cls: type[_ty.Any]) -> list[dict]:
     return alternatives
 
 
-def dataclass_to_obj(cls: type[_ty.Any]) -> _ty.Any:
-    if _dc.is_dataclass(cls):
-        return {f.name: _get_field_default(f) for f in _dc.fields(cls)}
+# 型ごとの `dataclass_to_obj` の結果。入れ子の型の結果を共有しているため、
+# 外に渡すときは `_copy_example` で複製する
+def _make_example(cls: type[_ty.Any]) -> _ty.Any:
+    info = _get_type_info(cls)
+    match info.kind:
+        case "dataclass":
+            return {f.name: _get_field_default(f) for f in info.fields}
+        case "optional":
+            return _get_example(info.args[0])
+        case "union" | "literal":
+            from . import _yamlio
+
+            if info.kind == "union":
+                alternatives = _copy_example(_get_alternatives(cls))
+            else:
+                alternatives = info.args
+            return _yamlio.BlockScalarStr(_yamlio.dump(alternatives))
+        case "list" if info.origin is list:
+            elem_type = info.args[0]
+            if _get_type_info(elem_type).origin is _ty.Union:
+                return _get_alternatives(elem_type)
+            return [_get_example(elem_type)]
+        case "array":
+            return [_get_example(info.args[0])]
 
-    if _is_optional(cls):
-        return dataclass_to_obj(_ty.get_args(cls)[0])
+    # その他の型の場合
+    return f"{cls}"
 
-    if _ty.get_origin(cls) is _ty.Union:
-        alternatives = _get_alternatives(cls)
-        return _BlockScalarStr(
-            _yaml.dump(alternatives, Dumper=_YAMLDumper, sort_keys=False)
-        )
 
-    if _ty.get_origin(cls) is _ty.Literal:
-        alternatives = _ty.get_args(cls)
-        return _BlockScalarStr(
-            _yaml.dump(alternatives, Dumper=_YAMLDumper, sort_keys=False)
-        )
+_examples = _TypeCache(_make_example)
+_get_example = _examples.get
 
-    if _ty.get_origin(cls) is list:
-        elem_type = _ty.get_args(cls)[0]
-        if _ty.get_origin(elem_type) is _ty.Union:
-            return _get_alternatives(elem_type)
-        return [dataclass_to_obj(elem_type)]
 
-    # その他の型の場合
-    return f"{cls}"
+def _copy_example(obj):
+    # 共有している部分も別のオブジェクトにする (YAML のエイリアスを避ける)
+    if type(obj) is dict:
+        return {k: _copy_example(v) for k, v in obj.items()}
+    if type(obj) is list:
+        return [_copy_example(v) for v in obj]
+    return _copy.deepcopy(obj)
+
+
+def dataclass_to_obj(cls: type[_ty.Any]) -> _ty.Any:
+    return _copy_example(_get_example(cls))
 
 
 def emit_yaml_example(cls: type[_ty.Any], filepath: Path):
+    from . import _yamlio
+
     yaml_obj = dataclass_to_obj(cls)
     with open(filepath, "w") as f:
-        _yaml.dump(
-            yaml_obj, f, Dumper=_YAMLDumper, default_flow_style=False, sort_keys=False
-        )
+        _yamlio.dump(yaml_obj, f)
+
+
+def _uses_function(data, *names: str) -> bool:
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if node.get("FUNC") in names:
+                return True
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return False
+
+
+def make_from_arguments[T](
+    cls: type[T],
+    *,
+    lazy_matrix: bool = False,
+    workers: int = 1,
+    cache: "_ty.Union[bool, _cache.ConfigCache]" = False,
+    parents: "_abc.Sequence[_argparse.ArgumentParser]" = (),
+) -> T:
+    """コマンドライン引数の `--config` で指定した YAML を `cls` に変換する
 
+    `parents` に渡したパーサの引数も受け付ける (値は呼び出し側で読む)。
 
-def make_from_arguments[T](cls: type[T]) -> T:
-    parser = ArgumentParser()
+    `cache` を指定した場合、デコード結果をディスクに保存し、設定ファイルの
+    内容・型の構造・指定したパス・作業ディレクトリが同じであれば再利用する。
+    キャッシュから読んだ場合はデータクラスの `__post_init__` を実行しないため、
+    検証やディレクトリの作成などの副作用がある型には使わないこと。
+    """
+    from argparse import ArgumentParser
+
+    from . import cache as _cache
+
+    parser = ArgumentParser(parents=list(parents))
     parser.add_argument("--config", type=Path, help="YAML configuration file")
     parser.add_argument("--emit_example", type=Path, help="emit configuration example")
+    parser.add_argument(
+        "--no_cache", action="store_true", help="do not use the decoded config cache"
+    )
+    parser.add_argument("--profile", type=Path, help="write a decoding profile as JSON")
     args = parser.parse_args()
 
     if args.emit_example is not None:
         emit_yaml_example(cls, args.emit_example)
         quit()
 
-    with open(args.config) as f:
-        data = _yaml.safe_load(f)
+    with open(args.config, "rb") as f:
+        content = f.read()
+
+    store: _ty.Optional[_cache.ConfigCache] = None
+    if cache and not (args.no_cache or lazy_matrix or args.profile):
+        store = _cache.ConfigCache() if cache is True else cache
+    if store is not None:
+        # FilePath などの結果は指定したパスと作業ディレクトリに依存する
+        key = store.key(cls, content, str(args.config), os.getcwd())
+        try:
+            return store.load(key)
+        except KeyError:
+            pass
+
+    from . import _yamlio
+
+    data = _yamlio.load(content)
+    decode = _ft.partial(
+        obj_to_dataclass,
+        cls,
+        data,
+        filepath=args.config,
+        lazy_matrix=lazy_matrix,
+        workers=workers,
+    )
+    if args.profile is not None:
+        with DecodeProfile() as profile:
+            result = decode()
+        profile.dump(args.profile)
+    else:
+        result = decode()
+    # Wildcard の結果はファイルシステムの状態に依存するためキャッシュしない
+    if store is not None and not _uses_function(data, "Wildcard"):
+        store.store(key, result)
+    return result
+
 
-    return obj_to_dataclass(cls, data, filepath=args.config)
+# 型ごとにコンパイルしたエンコーダ: data -> YAML に出力できるオブジェクト
+_Encoder = _ty.Callable[[_ty.Any], _ty.Any]
 
 
-def asdict(data, cls: _ty.Optional[type[_ty.Any]] = None):
-    if cls is None:
-        cls = type(data)
+def _identity(data):
+    return data
+
+
+def _encode_any(data):
+    return _get_encoder(type(data))(data)
 
+
+def _compile_encoder(cls: type[_ty.Any]) -> _Encoder:
     if _dc.is_dataclass(cls):
-        return {f.name: asdict(getattr(data, f.name), f.type) for f in _dc.fields(data)}
+        return _compile_dataclass_encoder(cls)
+
+    origin = _ty.get_origin(cls)
+    encode: _Encoder
+    if origin is _ty.Union:
+        encode = _compile_union_encoder(cls)
+    elif origin is list:
+        encode_item = _get_encoder(_ty.get_args(cls)[0])
+        if encode_item is _identity:
+            encode = list
+        else:
+
+            def encode(data):
+                return [encode_item(v) for v in data]
+
+    elif cls is list:
+
+        def encode(data):
+            return [_encode_any(v) for v in data]
+
+    elif origin is tuple:
+        elem_encoders = [_get_encoder(t) for t in _ty.get_args(cls)]
+
+        def encode(data):
+            return tuple(e(v) for v, e in zip(data, elem_encoders, strict=False))
+
+    elif cls is tuple:
+
+        def encode(data):
+            return tuple(_encode_any(v) for v in data)
+
+    elif origin is dict:
+        key_t, value_t = _ty.get_args(cls)
+        encode_key = _get_encoder(key_t)
+        encode_value = _get_encoder(value_t)
+        if encode_key is _identity and encode_value is _identity:
+            encode = dict
+        else:
+
+            def encode(data):
+                return {encode_key(k): encode_value(v) for k, v in data.items()}
+
+    elif cls is dict:
+
+        def encode(data):
+            return {_encode_any(k): _encode_any(v) for k, v in data.items()}
 
-    if _ty.get_origin(cls) is _ty.Union:
-        args = _ty.get_args(cls)
+    elif _get_type_info(cls).kind == "array":
+
+        def encode(data):
+            return data.tolist()
+
+    else:
+        encode = _identity
+    return encode
+
+
+_encoders = _TypeCache(_compile_encoder)
+_get_encoder = _encoders.get
+
+
+def _compile_dataclass_encoder(cls) -> _Encoder:
+    field_encoders: list[tuple[str, _Encoder]] = []
+
+    def encode(data):
+        # サブクラスなどはインスタンスのフィールドに従う
+        if type(data) is not cls:
+            return {
+                f.name: asdict(getattr(data, f.name), f.type) for f in _dc.fields(data)
+            }
+        return {name: e(getattr(data, name)) for name, e in field_encoders}
+
+    with _encoders.registering(cls, encode):
+        field_encoders.extend((f.name, _get_encoder(f.type)) for f in _dc.fields(cls))
+    return encode
+
+
+def _compile_union_encoder(cls) -> _Encoder:
+    args = _ty.get_args(cls)
+
+    def encode(data):
         assert type(data) in args, f"{type(data)=} should be contained in {args=}"
         return {
             "TYPE": type(data).__name__,
-            "ARGS": asdict(data),
+            "ARGS": _encode_any(data),
         }
 
-    if _ty.get_origin(cls) is list:
-        typ = _ty.get_args(cls)[0]
-        return [asdict(v, typ) for v in data]
+    return encode
 
-    if cls is list:
-        return [asdict(v) for v in data]
 
-    if _ty.get_origin(cls) is tuple:
-        elems = _ty.get_args(cls)
-        return tuple(asdict(v, typ) for v, typ in zip(data, elems, strict=False))
+def asdict(data, cls: _ty.Optional[type[_ty.Any]] = None):
+    if cls is None:
+        cls = type(data)
+    return _get_encoder(cls)(data)
 
-    if cls is tuple:
-        return tuple(asdict(v) for v in data)
 
-    if _ty.get_origin(cls) is dict:
-        key_t = _ty.get_args(cls)[0]
-        value_t = _ty.get_args(cls)[1]
-        return {asdict(k, key_t): asdict(v, value_t) for k, v in data.items()}
+# 型ごとにコンパイルした、`asdict` の結果を YAML のイベントとして直接出力する関数
+_Emitter = _ty.Callable[[_ty.Any, _ty.Any], None]
 
-    if cls is dict:
-        return {asdict(k): asdict(v) for k, v in data.items()}
 
-    return data
+def _emit_any(dumper, data) -> None:
+    _get_emitter(type(data))(dumper, data)
+
+
+def _compile_emitter(cls: type[_ty.Any]) -> _Emitter:
+    from ._yamlio import (
+        MAPPING_END,
+        MAPPING_START,
+        SEQUENCE_END,
+        SEQUENCE_START,
+    )
+    from ._yamlio import emit_value as _emit_value
+
+    if _dc.is_dataclass(cls):
+        return _compile_dataclass_emitter(cls)
+
+    origin = _ty.get_origin(cls)
+    emit: _Emitter
+    if origin is _ty.Union:
+        emit = _compile_union_emitter(cls)
+    elif origin is list or cls is list:
+        emit_item = _get_emitter(_ty.get_args(cls)[0]) if origin else _emit_any
+
+        def emit(dumper, data):
+            dumper.emit(SEQUENCE_START)
+            for v in data:
+                emit_item(dumper, v)
+            dumper.emit(SEQUENCE_END)
+
+    elif origin is tuple:
+        elem_emitters = [_get_emitter(t) for t in _ty.get_args(cls)]
+
+        def emit(dumper, data):
+            dumper.emit(SEQUENCE_START)
+            for v, e in zip(data, elem_emitters, strict=False):
+                e(dumper, v)
+            dumper.emit(SEQUENCE_END)
+
+    elif cls is tuple:
+        emit = _get_emitter(list)
+    elif origin is dict or cls is dict:
+        if origin:
+            key_t, value_t = _ty.get_args(cls)
+            emit_key, emit_value = _get_emitter(key_t), _get_emitter(value_t)
+        else:
+            emit_key = emit_value = _emit_any
+
+        def emit(dumper, data):
+            dumper.emit(MAPPING_START)
+            for k, v in data.items():
+                emit_key(dumper, k)
+                emit_value(dumper, v)
+            dumper.emit(MAPPING_END)
+
+    elif _get_type_info(cls).kind == "array":
+
+        def emit(dumper, data):
+            _emit_value(dumper, data.tolist())
+
+    else:
+        emit = _emit_value
+    return emit
+
+
+_emitters = _TypeCache(_compile_emitter)
+_get_emitter = _emitters.get
+
+
+def _compile_dataclass_emitter(cls) -> _Emitter:
+    from ._yamlio import MAPPING_END, MAPPING_START, str_event
+    from ._yamlio import emit_value as _emit_value
+
+    field_emitters: list[tuple[_ty.Any, str, _Emitter]] = []
+
+    def emit(dumper, data):
+        if type(data) is not cls:
+            _emit_value(dumper, asdict(data, cls))
+            return
+        dumper.emit(MAPPING_START)
+        for key_event, name, e in field_emitters:
+            dumper.emit(key_event)
+            e(dumper, getattr(data, name))
+        dumper.emit(MAPPING_END)
+
+    with _emitters.registering(cls, emit):
+        field_emitters.extend(
+            (str_event(f.name), f.name, _get_emitter(f.type)) for f in _dc.fields(cls)
+        )
+    return emit
+
+
+def _compile_union_emitter(cls) -> _Emitter:
+    from ._yamlio import MAPPING_END, MAPPING_START, str_event
+    from ._yamlio import emit_value as _emit_value
+
+    args = _ty.get_args(cls)
+    type_key = str_event("TYPE")
+    args_key = str_event("ARGS")
+
+    def emit(dumper, data):
+        assert type(data) in args, f"{type(data)=} should be contained in {args=}"
+        dumper.emit(MAPPING_START)
+        dumper.emit(type_key)
+        _emit_value(dumper, type(data).__name__)
+        dumper.emit(args_key)
+        _emit_any(dumper, data)
+        dumper.emit(MAPPING_END)
+
+    return emit
+
+
+def dump_yaml(data, stream: _ty.IO[str], cls: _ty.Optional[type[_ty.Any]] = None):
+    """`asdict(data, cls)` を YAML として出力する
+
+    `asdict` の結果を組み立てずに、`data` を辿りながら逐次的に書き出す。
+    同じオブジェクトが複数回現れてもアンカーやエイリアスは使わない。
+    """
+    if cls is None:
+        cls = type(data)
+    from . import _yamlio
+
+    _yamlio.emit_document(stream, _get_emitter(cls), data)
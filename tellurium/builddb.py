@@ -0,0 +1,139 @@
+import os
+import threading as _threading
+import typing as _ty
+from pathlib import Path
+
+if _ty.TYPE_CHECKING:
+    from .make import BuildRule, StatCache
+
+__all__ = [
+    "BuildDatabase",
+]
+
+_VERSION = 1
+
+
+def _file_digest(path: str) -> str:
+    import hashlib as _hashlib
+
+    with open(path, "rb") as f:
+        return _hashlib.file_digest(
+            f, lambda: _hashlib.blake2b(digest_size=16)
+        ).hexdigest()
+
+
+class BuildDatabase:
+    """ターゲットごとに、コマンドと入力ファイルの内容のハッシュを記録する
+
+    `Make(signatures=...)` で使う。入力の内容とコマンドが前回の実行時と
+    同じであれば、更新時刻が変わっていてもルールを実行しない。
+
+    ファイルのハッシュは (サイズ, 更新時刻) とともに保持し、どちらも変わって
+    いなければ読み直さない。複数のファイルは `threads` 個のスレッドで並列に読む。
+    内容は `save` でまとめて JSON として書き出す。
+    """
+
+    def __init__(self, path: Path, *, threads: int = 1) -> None:
+        self.path = path
+        self.threads = threads
+        # パス -> [サイズ, 更新時刻 (ns), ハッシュ]
+        self._files: dict[str, list] = {}
+        # ターゲット -> {"command": [...], "inputs": {パス: ハッシュ}}
+        self._targets: dict[str, dict[str, _ty.Any]] = {}
+        # この実行で使ったファイル (保存するときに使わなかったものを除く)
+        self._used: set[str] = set()
+        self._lock = _threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        import json
+
+        try:
+            with open(self.path, "rb") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            # 壊れたデータベースは使わない (すべて更新時刻で判定し直す)
+            return
+        if not isinstance(data, dict) or data.get("version") != _VERSION:
+            return
+        self._files = data.get("files", {})
+        self._targets = data.get("targets", {})
+
+    def save(self, targets: _ty.Optional[_ty.Iterable[str]] = None) -> None:
+        """記録を書き出す。`targets` を渡した場合はそれ以外の記録を破棄する"""
+        import json
+
+        with self._lock:
+            if targets is not None:
+                keep = set(targets)
+                self._targets = {k: v for k, v in self._targets.items() if k in keep}
+            used = self._used.union(
+                *(record.get("inputs", ()) for record in self._targets.values())
+            )
+            files = {k: v for k, v in self._files.items() if k in used}
+            payload = json.dumps(
+                {"version": _VERSION, "files": files, "targets": self._targets},
+                separators=(",", ":"),
+                sort_keys=True,
+            )
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(payload)
+        os.replace(tmp, self.path)
+
+    def digests(self, paths: _ty.Iterable[Path], stats: "StatCache") -> dict[str, str]:
+        """各ファイルの内容のハッシュ。存在しないファイルは FileNotFoundError"""
+        result: dict[str, str] = {}
+        pending: list[tuple[str, os.stat_result]] = []
+        with self._lock:
+            for path in paths:
+                key = os.fspath(path)
+                st = stats.stat(key)
+                if st is None:
+                    raise FileNotFoundError(f"No such file or directory: {key!r}")
+                self._used.add(key)
+                cached = self._files.get(key)
+                if cached is not None and cached[:2] == [st.st_size, st.st_mtime_ns]:
+                    result[key] = cached[2]
+                else:
+                    pending.append((key, st))
+
+        if len(pending) > 1 and self.threads > 1:
+            import concurrent.futures as _futures
+
+            with _futures.ThreadPoolExecutor(max_workers=self.threads) as executor:
+                digests = list(executor.map(_file_digest, [k for k, _ in pending]))
+        else:
+            digests = [_file_digest(k) for k, _ in pending]
+
+        with self._lock:
+            for (key, st), digest in zip(pending, digests, strict=True):
+                self._files[key] = [st.st_size, st.st_mtime_ns, digest]
+                result[key] = digest
+        return result
+
+    def _signature(self, rule: "BuildRule", stats: "StatCache") -> dict[str, _ty.Any]:
+        return {
+            "command": list(rule.command),
+            "inputs": self.digests(rule.dependencies, stats),
+        }
+
+    def changed(self, rule: "BuildRule", stats: "StatCache") -> _ty.Optional[bool]:
+        """前回の記録からコマンドか入力が変わったか。記録がない場合は None"""
+        with self._lock:
+            record = self._targets.get(str(rule.target))
+        if record is None:
+            return None
+        return record != self._signature(rule, stats)
+
+    def invalidate(self, rule: "BuildRule") -> None:
+        """次回は入力に関係なく `rule` を実行させる"""
+        with self._lock:
+            self._targets[str(rule.target)] = {}
+
+    def record(self, rule: "BuildRule", stats: "StatCache") -> None:
+        """`rule` を現在の入力とコマンドで実行したことを記録する"""
+        signature = self._signature(rule, stats)
+        with self._lock:
+            self._targets[str(rule.target)] = signature
@@ -0,0 +1,158 @@
+import dataclasses as _dc
+import functools as _ft
+import hashlib as _hashlib
+import os
+import pickle as _pickle
+import typing as _ty
+from pathlib import Path
+
+__all__ = [
+    "default_cache_dir",
+    "schema_fingerprint",
+    "ConfigCache",
+]
+
+# キャッシュ全体の既定の上限 (バイト)
+_DEFAULT_MAX_BYTES = 256 * 2**20
+_SUFFIX = ".pickle"
+
+
+def default_cache_dir() -> Path:
+    if "TELLURIUM_CACHE_DIR" in os.environ:
+        return Path(os.environ["TELLURIUM_CACHE_DIR"])
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "tellurium"
+
+
+@_ft.cache
+def _version() -> str:
+    from importlib import metadata
+
+    try:
+        return metadata.version("tellurium")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def _describe_type(typ, seen: set[int], out: list[str]) -> None:
+    if _dc.is_dataclass(typ):
+        out.append(f"{typ.__module__}.{typ.__qualname__}")
+        if id(typ) in seen:
+            return
+        seen.add(id(typ))
+        out.append("{")
+        for f in _dc.fields(typ):
+            out.append(f"{f.name}:")
+            _describe_type(f.type, seen, out)
+            if f.default is not _dc.MISSING:
+                out.append(f"={f.default!r}")
+            if f.default_factory is not _dc.MISSING:
+                factory = f.default_factory
+                out.append(f"=<{getattr(factory, '__qualname__', repr(factory))}>")
+        # `__post_init__` の変更もデコード結果に影響する
+        post_init = getattr(typ, "__post_init__", None)
+        code = getattr(post_init, "__code__", None)
+        if code is not None:
+            out.append(_hashlib.sha256(code.co_code).hexdigest())
+        out.append("}")
+    elif args := _ty.get_args(typ):
+        out.append(repr(_ty.get_origin(typ)))
+        out.append("[")
+        for arg in args:
+            _describe_type(arg, seen, out)
+            out.append(",")
+        out.append("]")
+    elif isinstance(typ, type):
+        out.append(f"{typ.__module__}.{typ.__qualname__}")
+    else:
+        out.append(repr(typ))
+
+
+def schema_fingerprint(cls: type[_ty.Any]) -> str:
+    """`cls` から辿れる型の構造 (フィールド名・型・デフォルト値) のハッシュ"""
+    out: list[str] = []
+    _describe_type(cls, set(), out)
+    return _hashlib.sha256(" ".join(out).encode()).hexdigest()
+
+
+@_dc.dataclass
+class ConfigCache:
+    """デコード済みの設定を、設定ファイルの内容と型の構造をキーとして保存する
+
+    エントリは pickle で保存し、合計サイズが `max_bytes` を超えた場合は
+    最後に使われた時刻の古いものから削除する。
+    """
+
+    directory: Path = _dc.field(default_factory=default_cache_dir)
+    max_bytes: int = _DEFAULT_MAX_BYTES
+
+    def key(self, cls: type[_ty.Any], content: bytes, *extra: _ty.Any) -> str:
+        h = _hashlib.sha256()
+        for part in (_version(), schema_fingerprint(cls), *map(repr, extra)):
+            h.update(part.encode())
+            h.update(b"\0")
+        h.update(content)
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}{_SUFFIX}"
+
+    def load(self, key: str) -> _ty.Any:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = _pickle.load(f)
+        except FileNotFoundError:
+            raise KeyError(key) from None
+        except Exception:
+            # 型の移動などで復元できないエントリは削除する
+            path.unlink(missing_ok=True)
+            raise KeyError(key) from None
+        # 最終使用時刻として更新時刻を使う
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def store(self, key: str, value: _ty.Any) -> bool:
+        try:
+            payload = _pickle.dumps(value, protocol=_pickle.HIGHEST_PROTOCOL)
+        except (_pickle.PicklingError, AttributeError, TypeError):
+            return False
+        if len(payload) > self.max_bytes:
+            return False
+
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self._path(key)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(payload)
+            os.replace(tmp, path)
+        except OSError:
+            return False
+        self.evict()
+        return True
+
+    def evict(self) -> None:
+        entries = []
+        try:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(_SUFFIX):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self) -> None:
+        for path in self.directory.glob(f"*{_SUFFIX}"):
+            path.unlink(missing_ok=True)
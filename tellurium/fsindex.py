@@ -0,0 +1,225 @@
+import fnmatch as _fnmatch
+import functools as _ft
+import os
+import re
+import typing as _ty
+from pathlib import PurePath
+
+__all__ = [
+    "DirectoryIndex",
+]
+
+# (名前, is_dir(), is_symlink())
+_Entry = tuple[str, bool, bool]
+
+
+@_ft.cache
+def _is_case_sensitive() -> bool:
+    return os.path.normcase("Aa") == "Aa"
+
+
+@_ft.lru_cache(maxsize=256)
+def _compile_pattern(pat: str) -> _ty.Callable[[str], _ty.Any]:
+    flags = re.NOFLAG if _is_case_sensitive() else re.IGNORECASE
+    return re.compile(_fnmatch.translate(pat), flags).match
+
+
+@_ft.lru_cache(maxsize=256)
+def _parse_pattern(pattern: str) -> tuple[str, ...]:
+    if not pattern:
+        raise ValueError(f"Unacceptable pattern: {pattern!r}")
+    path = PurePath(pattern)
+    if path.anchor:
+        raise NotImplementedError("Non-relative patterns are unsupported")
+    parts = list(path.parts)
+    if pattern[-1] in (os.sep, os.altsep):
+        # 末尾の区切り文字はディレクトリのみにマッチする
+        parts.append("")
+    for part in parts:
+        if "**" in part and part != "**":
+            raise ValueError(
+                "Invalid pattern: '**' can only be an entire path component"
+            )
+    return tuple(parts)
+
+
+@_ft.lru_cache(maxsize=64)
+def _compile_exclude(
+    exclude: tuple[str, ...],
+) -> _ty.Optional[_ty.Callable[[str], _ty.Any]]:
+    if not exclude:
+        return None
+    flags = re.NOFLAG if _is_case_sensitive() else re.IGNORECASE
+    return re.compile("|".join(map(_fnmatch.translate, exclude)), flags).match
+
+
+def _child(directory: str, name: str) -> str:
+    return name if directory == "." else f"{directory}{os.sep}{name}"
+
+
+class DirectoryIndex:
+    """`os.scandir` で読んだディレクトリの内容を保持し、glob をメモリ上で解決する
+
+    `Path(".").glob` と同じ結果を同じ順序で返す。各ディレクトリは最初に
+    必要になったときに一度だけ読む。ファイルシステムが変更された場合は
+    `invalidate` で保持している内容を破棄する。
+
+    `threads` が 2 以上の場合、`**` で辿る部分木をトップレベルの
+    サブディレクトリごとにスレッドで並列に読む。
+    """
+
+    def __init__(self, *, threads: int = 1) -> None:
+        self.threads = threads
+        # 読めないディレクトリは None
+        self._listings: dict[str, _ty.Optional[list[_Entry]]] = {}
+        self._is_dir: dict[str, bool] = {}
+
+    def _listing(self, directory: str) -> _ty.Optional[list[_Entry]]:
+        try:
+            return self._listings[directory]
+        except KeyError:
+            pass
+
+        listing: _ty.Optional[list[_Entry]] = None
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            pass
+        else:
+            listing = []
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                try:
+                    is_symlink = entry.is_symlink()
+                except OSError:
+                    is_symlink = False
+                listing.append((entry.name, is_dir, is_symlink))
+                self._is_dir[_child(directory, entry.name)] = is_dir
+        self._listings[directory] = listing
+        return listing
+
+    def is_dir(self, path: str) -> bool:
+        try:
+            return self._is_dir[path]
+        except KeyError:
+            pass
+        result = self._is_dir[path] = os.path.isdir(path)
+        return result
+
+    def path_to_str(self, path: str) -> str:
+        return f"{path}/" if self.is_dir(path) else path
+
+    def glob(self, pattern: str, exclude: _ty.Iterable[str] = ()) -> list[str]:
+        """カレントディレクトリからの相対パターンにマッチするパスのリスト
+
+        `exclude` のいずれかにマッチする名前のファイルやディレクトリは
+        結果に含めず、その下も辿らない (例: `[".git", "__pycache__"]`)。
+        """
+        parts = _parse_pattern(pattern)
+        excluded = _compile_exclude(tuple(exclude))
+        if not self.is_dir("."):
+            return []
+        # `**` が複数ある場合は同じパスが複数回見つかる
+        return list(dict.fromkeys(self._select(".", parts, 0, excluded)))
+
+    def _select(
+        self,
+        path: str,
+        parts: tuple[str, ...],
+        index: int,
+        excluded: _ty.Optional[_ty.Callable[[str], _ty.Any]],
+    ) -> _ty.Iterator[str]:
+        if index == len(parts) or not parts[index]:
+            yield path
+            return
+
+        part = parts[index]
+        if part == "..":
+            yield from self._select(_child(path, part), parts, index + 1, excluded)
+        elif part == "**":
+            while index < len(parts) and parts[index] == "**":
+                index += 1
+            if self.threads > 1:
+                self._prefetch(path, excluded)
+            for directory in self._walk(path, excluded):
+                yield from self._select(directory, parts, index, excluded)
+        else:
+            listing = self._listing(path)
+            if listing is None:
+                return
+            match = _compile_pattern(part)
+            dironly = index + 1 < len(parts)
+            if not dironly:
+                # 最後の要素は再帰せずにまとめて返す
+                yield from (
+                    _child(path, name)
+                    for name, _, _ in listing
+                    if match(name) and not (excluded and excluded(name))
+                )
+                return
+            for name, is_dir, _ in listing:
+                if not is_dir:
+                    continue
+                if match(name) and not (excluded and excluded(name)):
+                    child = _child(path, name)
+                    yield from self._select(child, parts, index + 1, excluded)
+
+    def _subdirectories(
+        self, directory: str, excluded: _ty.Optional[_ty.Callable[[str], _ty.Any]]
+    ) -> list[str]:
+        listing = self._listing(directory)
+        if listing is None:
+            return []
+        return [
+            _child(directory, name)
+            for name, is_dir, is_symlink in listing
+            if is_dir and not is_symlink and not (excluded and excluded(name))
+        ]
+
+    def _walk(
+        self, top: str, excluded: _ty.Optional[_ty.Callable[[str], _ty.Any]]
+    ) -> _ty.Iterator[str]:
+        # `Path.walk` と同じ順序でディレクトリを辿る (シンボリックリンクは辿らない)
+        yield top
+        stack = [top]
+        while stack:
+            children = self._subdirectories(stack.pop(), excluded)
+            yield from children
+            stack += reversed(children)
+
+    def _prefetch(
+        self, top: str, excluded: _ty.Optional[_ty.Callable[[str], _ty.Any]]
+    ) -> None:
+        import concurrent.futures as _futures
+
+        # 結果の順序は `_walk` で決まるため、ここではディレクトリを読むだけ
+        def fill(directory: str) -> None:
+            stack = [directory]
+            while stack:
+                stack += self._subdirectories(stack.pop(), excluded)
+
+        children = [
+            child
+            for child in self._subdirectories(top, excluded)
+            if child not in self._listings
+        ]
+        if len(children) < 2:
+            return
+        with _futures.ThreadPoolExecutor(max_workers=self.threads) as executor:
+            list(executor.map(fill, children))
+
+    def invalidate(self, path: _ty.Union[str, os.PathLike, None] = None) -> None:
+        """`path` 以下 (省略した場合はすべて) の保持している内容を破棄する"""
+        if path is None or str(PurePath(path)) == ".":
+            self._listings.clear()
+            self._is_dir.clear()
+            return
+        path = str(PurePath(path))
+        prefix = f"{path}{os.sep}"
+        for cache in (self._listings, self._is_dir):
+            for key in [k for k in cache if k == path or k.startswith(prefix)]:
+                del cache[key]
@@ -1,8 +1,11 @@
 import dataclasses as _dc
+import functools as _ft
 import re
 import typing as _ty
 from pathlib import Path
 
+from .fsindex import DirectoryIndex
+
 __all__ = [
     "FilePath",
     "FileName",
@@ -39,6 +42,144 @@ class FileFmt:
     fmt: str
 
 
+# この要素数以上のリストは NumPy でまとめて置換する
+_NUMPY_MIN_TEXTS = 50_000
+# NumPy の固定長文字列は最長の要素に合わせて確保されるため、長い要素があれば使わない
+_NUMPY_MAX_LENGTH = 4096
+# `.` 以外で正規表現として特別な意味を持つ文字 (改行と NUL は高速化の対象外とする)
+_REGEX_SPECIAL = frozenset("^$*+?{}[]\\|()\n\x00")
+
+
+def _literal_runs(pat: str) -> tuple[tuple[int, str], ...]:
+    # `.` 以外の文字が連続する部分とその位置
+    return tuple((m.start(), m.group()) for m in re.finditer(r"[^.]+", pat))
+
+
+@_dc.dataclass(frozen=True)
+class _RegexSubst:
+    pattern: re.Pattern
+    repl: str
+
+    def sub(self, text: str) -> str:
+        return self.pattern.sub(self.repl, text)
+
+    def sub_all(self, texts: list[str]) -> list[str]:
+        sub = self.pattern.sub
+        return [sub(self.repl, text) for text in texts]
+
+
+@_dc.dataclass(frozen=True)
+class _AffixSubst:
+    """`prefix%suffix` 形式のパターンを正規表現を使わずに置換する
+
+    `^prefix(.*)suffix$` による置換と同じ結果を返す。`prefix` と `suffix` は
+    固定長なので、`.` を含んでいても一致する位置は長さから決まる。
+    """
+
+    prefix: str
+    suffix: str
+    # replacement を `%` で分割したもの
+    pieces: tuple[str, ...]
+    prefix_runs: tuple[tuple[int, str], ...]
+    suffix_runs: tuple[tuple[int, str], ...]
+
+    def _match(self, body: str) -> bool:
+        # `.` は改行以外の任意の 1 文字にマッチする (改行を含む文字列は呼び出し側で除く)
+        start = len(body) - len(self.suffix)
+        if start < len(self.prefix):
+            return False
+        for offset, literal in self.prefix_runs:
+            if not body.startswith(literal, offset):
+                return False
+        for offset, literal in self.suffix_runs:
+            if not body.startswith(literal, start + offset):
+                return False
+        return True
+
+    def sub(self, text: str) -> str:
+        # `$` は末尾の改行の直前にもマッチする
+        body, tail = (text[:-1], "\n") if text.endswith("\n") else (text, "")
+        if "\n" in body or not self._match(body):
+            return text
+        stem = body[len(self.prefix) : len(body) - len(self.suffix)]
+        return stem.join(self.pieces) + tail
+
+    def sub_all(self, texts: list[str]) -> list[str]:
+        if len(texts) >= _NUMPY_MIN_TEXTS:
+            result = self._sub_all_numpy(texts)
+            if result is not None:
+                return result
+
+        start, stop = len(self.prefix), -len(self.suffix) or None
+        pieces, match, sub = self.pieces, self._match, self.sub
+        return [
+            (text[start:stop].join(pieces) if match(text) else text)
+            if "\n" not in text
+            else sub(text)
+            for text in texts
+        ]
+
+    def _sub_all_numpy(self, texts: list[str]) -> _ty.Optional[list[str]]:
+        try:
+            import numpy as np
+        except ImportError:
+            return None
+        if not hasattr(np.strings, "slice"):
+            return None
+        try:
+            joined = "".join(texts)
+        except TypeError:
+            return None
+        # 固定長文字列では末尾の NUL が失われる。改行の扱いは `sub` に任せる
+        if "\x00" in joined or "\n" in joined:
+            return None
+        if max(map(len, texts)) > _NUMPY_MAX_LENGTH:
+            return None
+
+        array = np.array(texts, dtype=str)
+        n = np.strings.str_len(array)
+        start = n - len(self.suffix)
+        mask = start >= len(self.prefix)
+        for offset, literal in self.prefix_runs:
+            stop = offset + len(literal)
+            mask &= np.strings.slice(array, offset, stop) == literal
+        for offset, literal in self.suffix_runs:
+            stop = start + offset + len(literal)
+            mask &= np.strings.slice(array, start + offset, stop) == literal
+        stem = np.strings.slice(array, len(self.prefix), start)
+        result = self.pieces[0]
+        for piece in self.pieces[1:]:
+            result = np.strings.add(np.strings.add(result, stem), piece)
+        return np.where(mask, result, array).tolist()
+
+
+@_ft.lru_cache(maxsize=256)
+def _compile_pat_subst(
+    pattern: str, replacement: str
+) -> _ty.Union[_RegexSubst, _AffixSubst]:
+    prefix, percent, suffix = pattern.partition("%")
+    if (
+        percent
+        and "%" not in suffix
+        and _REGEX_SPECIAL.isdisjoint(pattern)
+        and "\\" not in replacement
+        and "\x00" not in replacement
+        # `%1` は `\11` (11 番目のグループ) になる
+        and re.search(r"%\d", replacement) is None
+    ):
+        return _AffixSubst(
+            prefix,
+            suffix,
+            tuple(replacement.split("%")),
+            _literal_runs(prefix),
+            _literal_runs(suffix),
+        )
+    return _RegexSubst(
+        re.compile(f"^{pattern.replace('%', '(.*)')}$"),
+        replacement.replace("%", r"\1"),
+    )
+
+
 @_dc.dataclass
 class PatSubst:
     pattern: str
@@ -46,12 +187,11 @@ class PatSubst:
     texts: _ty.Union[str, list[str]]
 
     def run(self) -> _ty.Union[str, list[str]]:
-        pattern = re.compile(f"^{self.pattern.replace('%', '(.*)')}$")
-        repl = self.replacement.replace("%", r"\1")
+        subst = _compile_pat_subst(self.pattern, self.replacement)
         if isinstance(self.texts, str):
-            return pattern.sub(repl, self.texts)
+            return subst.sub(self.texts)
         else:
-            return [pattern.sub(repl, text) for text in self.texts]
+            return subst.sub_all(self.texts)
 
 
 def path_to_str(path: Path) -> str:
@@ -64,9 +204,15 @@ def path_to_str(path: Path) -> str:
 @_dc.dataclass
 class Wildcard:
     pattern: str
-
-    def run(self) -> list[str]:
-        return [path_to_str(path) for path in Path(".").glob(self.pattern)]
+    # マッチしても結果に含めず、辿らない名前のパターン (例: .git)
+    exclude: list[str] = _dc.field(default_factory=list)
+
+    def run(self, index: _ty.Optional[DirectoryIndex] = None) -> list[str]:
+        if index is None:
+            index = DirectoryIndex()
+        return [
+            index.path_to_str(path) for path in index.glob(self.pattern, self.exclude)
+        ]
 
 
 @_dc.dataclass
@@ -1,7 +1,15 @@
 import dataclasses as _dc
-import subprocess as _sp
+import functools as _ft
+import heapq as _heapq
+import os
+import typing as _ty
 from pathlib import Path
 
+if _ty.TYPE_CHECKING:
+    import concurrent.futures as _futures
+
+    from .builddb import BuildDatabase
+
 
 # dataclass を使用してルールを定義
 @_dc.dataclass
@@ -11,11 +19,94 @@ class BuildRule:
     command: list[str]
 
 
-def needs_update(target: Path, dependencies: list[Path]) -> bool:
-    if not target.exists():
+class StatCache:
+    """ファイルの更新時刻を保持し、同じファイルを何度も stat しないようにする
+
+    `Make.run` の 1 回の実行の間だけ使う。`prefill` の場合、ディレクトリごとに
+    最初に必要になったときに `os.scandir` で内容を読み、存在しないファイルは
+    stat せずに判定する。コマンドで更新したファイルは `invalidate` する。
+    """
+
+    def __init__(self, *, prefill: bool = False) -> None:
+        self.prefill = prefill
+        # パス -> stat の結果 (存在しない場合は None)
+        self._stats: dict[str, _ty.Optional[os.stat_result]] = {}
+        # ディレクトリ -> 名前 -> エントリ (読めない場合は None)
+        self._listings: dict[str, _ty.Optional[dict[str, os.DirEntry]]] = {}
+        # 読んだ後に変更された可能性があるパス
+        self._stale: set[str] = set()
+
+    def _listing(self, directory: str) -> _ty.Optional[dict[str, os.DirEntry]]:
+        try:
+            return self._listings[directory]
+        except KeyError:
+            pass
+        listing = None
+        try:
+            with os.scandir(directory) as it:
+                listing = {entry.name: entry for entry in it}
+        except OSError:
+            pass
+        self._listings[directory] = listing
+        return listing
+
+    def stat(self, path: _ty.Union[str, os.PathLike]) -> _ty.Optional[os.stat_result]:
+        """`path` の stat の結果。存在しない場合は None"""
+        key = os.fspath(path)
+        try:
+            return self._stats[key]
+        except KeyError:
+            pass
+
+        stat: _ty.Callable[[], os.stat_result] = _ft.partial(os.stat, key)
+        if self.prefill and key not in self._stale:
+            directory, name = os.path.split(key)
+            listing = self._listing(directory or ".")
+            if listing is not None:
+                entry = listing.get(name)
+                if entry is None:
+                    self._stats[key] = None
+                    return None
+                # Windows 以外では 1 回だけ stat し、結果はエントリが保持する
+                stat = entry.stat
+        result: _ty.Optional[os.stat_result]
+        try:
+            result = stat()
+        except (FileNotFoundError, NotADirectoryError):
+            result = None
+        self._stats[key] = result
+        return result
+
+    def mtime(self, path: _ty.Union[str, os.PathLike]) -> _ty.Optional[float]:
+        """`path` の更新時刻。存在しない場合は None"""
+        result = self.stat(path)
+        return None if result is None else result.st_mtime
+
+    def exists(self, path: _ty.Union[str, os.PathLike]) -> bool:
+        return self.mtime(path) is not None
+
+    def invalidate(self, path: _ty.Union[str, os.PathLike]) -> None:
+        """`path` が変更されたため、次に必要になったときに stat し直す"""
+        key = os.fspath(path)
+        self._stats.pop(key, None)
+        self._stale.add(key)
+
+
+def needs_update(
+    target: Path, dependencies: list[Path], stats: _ty.Optional[StatCache] = None
+) -> bool:
+    if stats is None:
+        stats = StatCache()
+    target_time = stats.mtime(target)  # 最終更新時間
+    if target_time is None:
         return True
-    target_time = target.stat().st_mtime  # 最終更新時間
-    return any(dep.stat().st_mtime > target_time for dep in dependencies)
+    for dep in dependencies:
+        dep_time = stats.mtime(dep)
+        if dep_time is None:
+            raise FileNotFoundError(f"No such file or directory: {str(dep)!r}")
+        if dep_time > target_time:
+            return True
+    return False
 
 
 @_dc.dataclass
@@ -23,46 +114,388 @@ class Make:
     rules: dict[str, BuildRule]
     dry_run: bool = False
     done: set[str] = _dc.field(default_factory=set)
+    # 同時に実行するコマンドの数
+    jobs: int = 1
+    # ディレクトリごとに os.scandir で内容を読んでからファイルを調べる
+    prefill_stat: bool = False
+    # 指定した場合、入力の内容とコマンドの変更を記録するデータベースのパス
+    signatures: _ty.Optional[Path] = None
+    _stats: StatCache = _dc.field(
+        default_factory=StatCache, init=False, repr=False, compare=False
+    )
+    _db: "_ty.Optional[BuildDatabase]" = _dc.field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _graph: "_RuleGraph" = _dc.field(init=False, repr=False, compare=False)
 
     # タスクを実行
-    def _run(self, name: str) -> None:
-        if name not in self.rules:
-            if Path(name).exists():
-                return
-            else:
-                raise RuntimeError(f"No rule to make target `{name}`")
-        if name in self.done:
-            return
-
+    def _run(self, index: int) -> None:
+        graph = self._graph
+        name = graph.names[index]
         rule = self.rules[name]
-        # 依存関係を先に実行
-        for dep in rule.dependencies:
-            self._run(str(dep))
+        for dep in graph.sources[index]:
+            if not self._stats.exists(dep):
+                raise RuntimeError(f"No rule to make target `{dep}`")
 
         if self.dry_run:
             command = " ".join(rule.command)
             print(command)
         else:
             # ソースファイルがターゲットより新しければコマンドを実行
-            if needs_update(rule.target, rule.dependencies):
+            if self._needs_update(rule):
+                import subprocess as _sp
+
                 print(f"Running rule: {name}")
-                _sp.run(rule.command)
+                if self._db is not None:
+                    # 途中で失敗した場合は次回も実行する
+                    self._db.invalidate(rule)
+                returncode = _sp.run(rule.command).returncode
+                # 後続のルールが新しい更新時刻を見るようにする
+                self._stats.invalidate(rule.target)
+                if returncode != 0:
+                    raise RuntimeError(
+                        f"Rule `{name}` failed with exit status {returncode}"
+                    )
+                if self._db is not None:
+                    self._db.record(rule, self._stats)
             else:
                 print(f"Task {name} is up to date.")
 
-        self.done.add(name)
+    def _needs_update(self, rule: BuildRule) -> bool:
+        if self._db is None or not self._stats.exists(rule.target):
+            return needs_update(rule.target, rule.dependencies, self._stats)
+        changed = self._db.changed(rule, self._stats)
+        if changed is not None:
+            return changed
+        # 記録がない場合は更新時刻で判定し、最新であれば現在の状態を記録する
+        if needs_update(rule.target, rule.dependencies, self._stats):
+            return True
+        self._db.record(rule, self._stats)
+        return False
 
     def run(self) -> None:
-        for name in self.rules.keys():
-            self._run(name)
+        self._execute(self._prepare())
+
+    def _prepare(self) -> list[int]:
+        """依存関係を調べ、実行するルールの順序を返す"""
+        if self.jobs < 1:
+            raise ValueError(f"jobs should be positive: {self.jobs}")
+        graph = self._graph = _RuleGraph.compile(self.rules)
+        order = graph.order(self.done)
+        self._stats = StatCache(prefill=self.prefill_stat)
+        self._db = None
+        if self.signatures is not None and not self.dry_run:
+            from .builddb import BuildDatabase
+
+            self._db = BuildDatabase(self.signatures, threads=os.cpu_count() or 1)
+        return order
+
+    def _execute(self, order: list[int]) -> None:
+        graph = self._graph
+        if self._db is not None:
+            # ルールの出力でない入力ファイルは先にまとめて並列にハッシュを求める
+            sources = {dep for i in order for dep in graph.sources[i]}
+            self._db.digests(filter(self._stats.exists, sources), self._stats)
+        try:
+            if self.jobs == 1 or self.dry_run:
+                for i in order:
+                    self._run(i)
+                    self.done.add(graph.names[i])
+                return
+
+            import concurrent.futures as _futures
+
+            with _futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                self._run_parallel(graph, order, executor)
+        finally:
+            if self._db is not None:
+                self._db.save(self.rules.keys())
+
+    def watch(
+        self,
+        interval: float = 0.2,
+        *,
+        until: _ty.Optional[_ty.Callable[[], bool]] = None,
+    ) -> None:
+        """`run` した後、ソースファイルの変更を監視して影響するルールだけを実行し直す
 
+        `interval` 秒ごとにソースファイルを stat し、サイズか更新時刻が変わった
+        ものに依存するルールとその下流のルールを実行する。ルールの依存関係と
+        ファイルの状態は監視の間保持する。`until` が True を返すまで続ける。
+        ルールが失敗しても監視は続け、失敗したルールとそのために実行されなかった
+        ルールは次に変更を検出したときに実行する。
+        """
+        import sys
+        import time
 
-def run_rules(rules: list[BuildRule], dry_run: bool = False) -> None:
+        order = self._prepare()
+        graph = self._graph
+        position = {node: i for i, node in enumerate(graph.order())}
+        sources = list(graph.users())
+        snapshot = {path: _signature(path) for path in sources}
+        # 失敗して完了しなかったルール (次に変更を検出したときに実行する)
+        pending: set[int] = set()
+        while True:
+            if order:
+                self.done.difference_update(graph.names[i] for i in order)
+                try:
+                    self._execute(order)
+                except (RuntimeError, OSError) as error:
+                    print(error, file=sys.stderr, flush=True)
+                pending = {i for i in order if graph.names[i] not in self.done}
+            if until is not None and until():
+                return
+            time.sleep(interval)
+            changed = []
+            for path in sources:
+                signature = _signature(path)
+                if signature != snapshot[path]:
+                    snapshot[path] = signature
+                    changed.append(path)
+            for path in changed:
+                self._stats.invalidate(path)
+            order = []
+            if changed:
+                affected = graph.affected(changed) | pending
+                order = sorted(affected, key=position.__getitem__)
+
+    def _run_parallel(
+        self, graph: "_RuleGraph", order: list[int], executor: "_futures.Executor"
+    ) -> None:
+        import concurrent.futures as _futures
+
+        # 依存先のルールがすべて終わったものから、帰りがけ順の早い順に実行する
+        position = [-1] * len(graph.names)
+        for i, node in enumerate(order):
+            position[node] = i
+        waiting = [0] * len(graph.names)
+        dependents: list[list[int]] = [[] for _ in graph.names]
+        ready: list[int] = []
+        for i, node in enumerate(order):
+            for dep in graph.deps[node]:
+                if position[dep] >= 0:
+                    waiting[node] += 1
+                    dependents[dep].append(node)
+            if not waiting[node]:
+                _heapq.heappush(ready, i)
+
+        running: dict[_futures.Future, int] = {}
+        failure: _ty.Optional[BaseException] = None
+        while ready or running:
+            # 失敗した後は新しいコマンドを始めず、実行中のものが終わるのを待つ
+            while ready and len(running) < self.jobs and failure is None:
+                node = order[_heapq.heappop(ready)]
+                running[executor.submit(self._run, node)] = node
+            if not running:
+                break
+            finished, _ = _futures.wait(running, return_when=_futures.FIRST_COMPLETED)
+            for future in finished:
+                node = running.pop(future)
+                error = future.exception()
+                if error is not None:
+                    failure = failure or error
+                    continue
+                self.done.add(graph.names[node])
+                for dependent in dependents[node]:
+                    waiting[dependent] -= 1
+                    if waiting[dependent] == 0:
+                        _heapq.heappush(ready, position[dependent])
+        if failure is not None:
+            raise failure
+
+
+class _RuleGraph:
+    """ルールの依存関係を番号で表したもの
+
+    `deps[i]` はルール `names[i]` が依存するルールの番号 (依存関係の順),
+    `sources[i]` はルールの出力ではない依存先のファイル。
+    """
+
+    def __init__(
+        self,
+        names: list[str],
+        deps: list[list[int]],
+        sources: list[list[Path]],
+    ) -> None:
+        self.names = names
+        self.deps = deps
+        self.sources = sources
+        # 監視するときに作る逆向きの依存関係
+        self._users: _ty.Optional[dict[str, list[int]]] = None
+        self._dependents: _ty.Optional[list[list[int]]] = None
+
+    def users(self) -> dict[str, list[int]]:
+        """ルールの出力ではない依存先のファイル -> それに直接依存するルール"""
+        if self._users is None:
+            users: dict[str, list[int]] = {}
+            for i, paths in enumerate(self.sources):
+                for path in paths:
+                    users.setdefault(str(path), []).append(i)
+            self._users = users
+        return self._users
+
+    def dependents(self) -> list[list[int]]:
+        """各ルールに直接依存するルールの番号"""
+        if self._dependents is None:
+            dependents: list[list[int]] = [[] for _ in self.names]
+            for i, deps in enumerate(self.deps):
+                for dep in deps:
+                    dependents[dep].append(i)
+            self._dependents = dependents
+        return self._dependents
+
+    @classmethod
+    def compile(cls, rules: dict[str, BuildRule]) -> "_RuleGraph":
+        names = list(rules)
+        index = {name: i for i, name in enumerate(names)}
+        deps: list[list[int]] = []
+        sources: list[list[Path]] = []
+        for rule in rules.values():
+            rule_deps: list[int] = []
+            rule_sources: list[Path] = []
+            for dep in rule.dependencies:
+                i = index.get(str(dep))
+                if i is None:
+                    rule_sources.append(dep)
+                else:
+                    rule_deps.append(i)
+            deps.append(rule_deps)
+            sources.append(rule_sources)
+        return cls(names, deps, sources)
+
+    def order(self, done: _ty.Container[str] = ()) -> list[int]:
+        """依存関係を先に並べた、実行するルールの順序 (深さ優先の帰りがけ順)
+
+        `done` のルールとその依存先は含めない。循環があれば RuntimeError
+        """
+        deps = self.deps
+        # 0: 未訪問, 1: 訪問中, 2: 訪問済み
+        state = bytearray(len(self.names))
+        for i, name in enumerate(self.names):
+            if name in done:
+                state[i] = 2
+        order: list[int] = []
+        # 再帰の代わりに、訪問中のルールと次に調べる依存先の位置を積む
+        stack: list[int] = []
+        positions: list[int] = []
+        for root in range(len(self.names)):
+            if state[root]:
+                continue
+            state[root] = 1
+            stack.append(root)
+            positions.append(0)
+            while stack:
+                node = stack[-1]
+                edges = deps[node]
+                pos = positions[-1]
+                while pos < len(edges):
+                    child = edges[pos]
+                    pos += 1
+                    if state[child] == 0:
+                        break
+                    if state[child] == 1:
+                        cycle = stack[stack.index(child) :] + [child]
+                        path = " -> ".join(self.names[i] for i in cycle)
+                        raise RuntimeError(f"Circular dependency: {path}")
+                else:
+                    stack.pop()
+                    positions.pop()
+                    state[node] = 2
+                    order.append(node)
+                    continue
+                positions[-1] = pos
+                state[child] = 1
+                stack.append(child)
+                positions.append(0)
+        return order
+
+    def affected(self, paths: _ty.Iterable[str]) -> set[int]:
+        """`paths` のいずれかに依存するルールと、その下流のすべてのルール"""
+        users, dependents = self.users(), self.dependents()
+        stack = [i for path in paths for i in users.get(path, ())]
+        result = set(stack)
+        while stack:
+            for dependent in dependents[stack.pop()]:
+                if dependent not in result:
+                    result.add(dependent)
+                    stack.append(dependent)
+        return result
+
+
+def _signature(path: str) -> _ty.Optional[tuple[int, int]]:
+    """変更の検出に使う (サイズ, 更新時刻 (ns))。存在しない場合は None"""
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def run_rules(
+    rules: list[BuildRule],
+    dry_run: bool = False,
+    jobs: int = 1,
+    *,
+    prefill_stat: bool = False,
+    signatures: _ty.Optional[Path] = None,
+) -> None:
     rules_dict = {str(rule.target): rule for rule in rules}
-    Make(rules_dict, dry_run).run()
+    Make(
+        rules_dict,
+        dry_run,
+        jobs=jobs,
+        prefill_stat=prefill_stat,
+        signatures=signatures,
+    ).run()
 
 
-if __name__ == "__main__":
+def main() -> None:
+    from argparse import ArgumentParser
+
     from .arguments import make_from_arguments
 
-    run_rules(make_from_arguments(list[BuildRule]))
+    parser = ArgumentParser(add_help=False)
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        nargs="?",
+        const=os.cpu_count() or 1,
+        default=1,
+        help="number of commands to run at once (all cores if omitted)",
+    )
+    parser.add_argument(
+        "--signatures",
+        type=Path,
+        nargs="?",
+        const=Path(".tellurium_make.json"),
+        help="rebuild only when input contents or commands change, "
+        "recording them in this file",
+    )
+    parser.add_argument(
+        "--watch",
+        type=float,
+        nargs="?",
+        const=0.2,
+        metavar="SECONDS",
+        help="keep running and rebuild what depends on changed sources, "
+        "polling every SECONDS (0.2 if omitted)",
+    )
+    args = parser.parse_known_args()[0]
+    rules = make_from_arguments(list[BuildRule], cache=True, parents=[parser])
+    if args.watch is None:
+        run_rules(rules, jobs=args.jobs, signatures=args.signatures)
+        return
+    make = Make(
+        {str(rule.target): rule for rule in rules},
+        jobs=args.jobs,
+        signatures=args.signatures,
+    )
+    try:
+        make.watch(args.watch)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
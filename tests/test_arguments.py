@@ -1,11 +1,35 @@
-from dataclasses import dataclass
+import array
+import copy
+import io
+import json
+import sys
+from collections import Counter
+from dataclasses import dataclass, field
+from itertools import islice
 from pathlib import Path
 from textwrap import dedent
 from typing import Any, Literal, Optional, Union
 
+import numpy as np
+import numpy.typing as npt
 import pytest
-
-from tellurium.arguments import dataclass_to_obj, isinstance_generic, obj_to_dataclass
+import yaml
+
+from tellurium.arguments import (
+    DecodeProfile,
+    IncrementalDecoder,
+    LazyMatrix,
+    asdict,
+    dataclass_to_obj,
+    dump_yaml,
+    emit_yaml_example,
+    instantiate_generic,
+    isinstance_generic,
+    iter_obj_to_dataclass,
+    make_from_arguments,
+    obj_to_dataclass,
+)
+from tellurium.functional import PatSubst
 
 
 @dataclass
@@ -74,6 +98,36 @@ def test_dataclass_to_obj_list_of_union() -> None:
     assert obj == expected, f"{obj=}"
 
 
+def test_dataclass_to_obj_cached() -> None:
+    calls = []
+
+    def factory() -> list[str]:
+        calls.append(None)
+        return ["a"]
+
+    @dataclass
+    class Leaf:
+        names: list[str] = field(default_factory=factory)
+
+    @dataclass
+    class Root:
+        first: Leaf
+        second: Leaf
+
+    obj = dataclass_to_obj(Root)
+    assert obj == {"first": {"names": ["a"]}, "second": {"names": ["a"]}}
+    assert dataclass_to_obj(Root) == obj
+    assert len(calls) == 1
+    # 呼び出しごと、フィールドごとに別のオブジェクトを返す
+    assert obj["first"] is not obj["second"]
+    obj["first"]["names"].append("b")
+    assert dataclass_to_obj(Root) == {
+        "first": {"names": ["a"]},
+        "second": {"names": ["a"]},
+    }
+    assert "&" not in yaml.dump(obj)
+
+
 def test_obj_to_dataclass() -> None:
     obj = {
         "print": {
@@ -424,6 +478,36 @@ def test_obj_to_dataclass_matrix_with_other_function() -> None:
     assert data[0] == expected, f"{data=}"
 
 
+def test_obj_to_dataclass_matrix_reuses_independent_functions(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    calls = []
+    run = PatSubst.run
+
+    def counting_run(self):
+        calls.append(self.texts)
+        return run(self)
+
+    monkeypatch.setattr(PatSubst, "run", counting_run)
+    obj = {
+        "FUNC": "Matrix",
+        "ARGS": {
+            "mapping": {"n": [f"{n}.c" for n in range(10)]},
+            "template": {
+                "inputs": patsubst("%.c", "%.o", ["a.c", "b.c"]),
+                "output": patsubst("%.c", "%.o", placeholder("n")),
+            },
+        },
+    }
+    data = obj_to_dataclass(list[dict[str, Union[list[str], str]]], obj)
+    assert [item["output"] for item in data] == [f"{n}.o" for n in range(10)]
+    assert all(item["inputs"] == ["a.o", "b.o"] for item in data)
+    # 結果のリストは組み合わせごとに別のオブジェクトになる
+    assert data[0]["inputs"] is not data[1]["inputs"]
+    assert calls.count(["a.c", "b.c"]) == 1
+    assert len(calls) == 11
+
+
 def test_obj_to_dataclass_type_conversion_in_dict_key() -> None:
     obj = {
         42: "no_extension",
@@ -450,3 +534,464 @@ def test_obj_to_dataclass_union_tuple() -> None:
 
     data = obj_to_dataclass(Union[tuple[int, int], int], obj)
     assert data == (1, 2)
+
+
+def test_obj_to_dataclass_reuse_decoder() -> None:
+    @dataclass
+    class Group:
+        name: str
+        members: list[Print]
+
+    obj = {
+        "name": "greetings",
+        "members": [{"msg": "Hello"}, {"msg": "Goodbye"}],
+    }
+    data = obj_to_dataclass(list[Group], [obj])
+    assert data == [Group("greetings", [Print("Hello"), Print("Goodbye")])]
+    # 2 回目以降はコンパイル済みのデコーダが使われる
+    assert obj_to_dataclass(list[Group], [obj]) == data
+
+
+def test_obj_to_dataclass_union_order() -> None:
+    obj = [1, 2]
+    data = obj_to_dataclass(Union[tuple[int, ...], list[int]], obj)
+    assert data == (1, 2), f"{data=}"
+
+    data = obj_to_dataclass(Union[list[int], tuple[int, ...]], obj)
+    assert data == [1, 2], f"{data=}"
+
+
+def test_obj_to_dataclass_lazy_matrix() -> None:
+    obj = {
+        "FUNC": "Matrix",
+        "ARGS": {
+            "mapping": {
+                "input": ["a", "b", "c"],
+                "number": [0, 1],
+            },
+            "template": {
+                "input": placeholder("input"),
+                "output": placeholder("input"),
+                "config": {"FUNC": "FileName"},
+            },
+        },
+    }
+    eager = obj_to_dataclass(list[Task], obj, filepath=Path(__file__))
+    lazy = obj_to_dataclass(list[Task], obj, filepath=Path(__file__), lazy_matrix=True)
+    assert isinstance(lazy, LazyMatrix), f"{lazy=}"
+    assert len(lazy) == len(eager) == 6
+    assert list(lazy) == eager
+    assert [lazy[i] for i in range(-6, 6)] == eager + eager
+    assert list(lazy[1:5:2]) == eager[1:5:2]
+    assert list(lazy[::-1][:2]) == eager[::-1][:2]
+    with pytest.raises(IndexError):
+        lazy[6]
+
+
+def test_obj_to_dataclass_lazy_matrix_large_sweep() -> None:
+    axis = list(range(20))
+    obj = {
+        "FUNC": "Matrix",
+        "ARGS": {
+            "mapping": {f"x{i}": axis for i in range(6)},
+            "template": placeholder("x5"),
+        },
+    }
+    data = obj_to_dataclass(list[int], obj, lazy_matrix=True)
+    assert len(data) == 20**6
+    assert data[-1] == 19
+    assert list(data[:3]) == [0, 1, 2]
+    assert list(islice(data, 21, 23)) == [1, 2]
+
+
+def test_obj_to_dataclass_matrix_workers() -> None:
+    obj = {
+        "FUNC": "Matrix",
+        "ARGS": {
+            "mapping": {
+                "input": [f"{i}.toml" for i in range(10)],
+                "number": [0, 1, 2],
+            },
+            "template": {
+                "input": placeholder("input"),
+                "output": patsubst("%.toml", "%.png", placeholder("input")),
+                "config": filename(),
+            },
+        },
+    }
+    serial = obj_to_dataclass(list[Task], obj, filepath=Path(__file__))
+    parallel = obj_to_dataclass(list[Task], obj, filepath=Path(__file__), workers=2)
+    assert parallel == serial, f"{parallel=}"
+
+    obj["ARGS"]["template"]["config"] = placeholder("missing")
+    with pytest.raises(RuntimeError) as serial_error:
+        obj_to_dataclass(list[Task], obj, filepath=Path(__file__))
+    with pytest.raises(RuntimeError) as parallel_error:
+        obj_to_dataclass(list[Task], obj, filepath=Path(__file__), workers=2)
+    assert str(parallel_error.value) == str(serial_error.value)
+    assert "test_arguments.py:ARGS.template.config:" in str(parallel_error.value)
+
+
+def test_instantiate_generic_union() -> None:
+    typ = Union[dict[str, list[int]], dict[str, tuple[str, ...]]]
+    data = instantiate_generic({"a": ("x", "y"), "b": ["z"]}, typ)
+    assert data == {"a": ("x", "y"), "b": ("z",)}, f"{data=}"
+
+    data = instantiate_generic([1, "2", 3], list[Union[int, str]])
+    assert data == [1, "2", 3], f"{data=}"
+
+    with pytest.raises(TypeError):
+        instantiate_generic({"a": [1, "2"]}, typ)
+
+
+@pytest.mark.parametrize(
+    "convert",
+    [instantiate_generic, lambda obj, typ: obj_to_dataclass(typ, obj)],
+    ids=["instantiate_generic", "obj_to_dataclass"],
+)
+def test_union_walks_each_alternative_once(
+    convert, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    from tellurium import arguments
+
+    visits: Counter = Counter()
+    try_instantiate = arguments._try_instantiate
+
+    def counting(obj, typ):
+        visits[typ] += 1
+        return try_instantiate(obj, typ)
+
+    def unused(*args):
+        raise AssertionError("a Union should not be checked before converting")
+
+    monkeypatch.setattr(arguments, "_try_instantiate", counting)
+    monkeypatch.setattr(arguments, "isinstance_generic", unused)
+    typ = Union[dict[str, list[int]], dict[str, list[str]]]
+    obj = {"a": ["x", "y"], "b": ["z"], "c": []}
+    assert convert(obj, typ) == obj
+    # 一致しない候補は最初の不一致で打ち切り、一致する候補は 1 回だけ辿る
+    assert visits[dict[str, list[int]]] == 1
+    assert visits[list[int]] == 1
+    assert visits[dict[str, list[str]]] == 1
+    assert visits[list[str]] == len(obj)
+
+
+def test_isinstance_generic_homogeneous_containers() -> None:
+    numbers = list(range(1000))
+    assert isinstance_generic(numbers, list[int])
+    assert isinstance_generic([True, 1], list[int])
+    assert not isinstance_generic(numbers + ["1000"], list[int])
+    assert isinstance_generic(tuple(float(n) for n in numbers), tuple[float, ...])
+    assert not isinstance_generic(tuple(numbers), tuple[float, ...])
+    assert isinstance_generic({str(n): n for n in numbers}, dict[str, int])
+    assert not isinstance_generic({n: n for n in numbers}, dict[str, int])
+    assert isinstance_generic([numbers, []], list[list[int]])
+    assert isinstance_generic([1, "2"], tuple[int, str])
+    assert not isinstance_generic([1, "2", 3], tuple[int, str])
+    assert isinstance_generic(["x", 1], list[Any])
+
+
+def test_obj_to_dataclass_error_with_large_data() -> None:
+    @dataclass
+    class X:
+        values: list[Literal["a", "b"]]
+
+    obj = {"values": ["a", "b", {"huge": list(range(10**6))}]}
+    with pytest.raises(RuntimeError) as e:
+        obj_to_dataclass(X, obj, filepath=Path(__file__))
+    line, actual = str(e.value).split("\n")
+    assert line.startswith("test_arguments.py:values.list: "), f"{line=}"
+    assert actual == f"actual: {repr(obj['values'][2])[:77]}...", f"{actual=}"
+
+
+def test_emit_yaml_example(tmp_path: Path) -> None:
+    path = tmp_path / "example.yaml"
+    emit_yaml_example(Main, path)
+    expected = dedent("""
+        print:
+          msg: <class 'str'>
+        secret: |
+          - TYPE: Print
+            ARGS:
+              msg: <class 'str'>
+          - TYPE: int
+            ARGS: <class 'int'>
+        number: null
+        """).lstrip("\n")
+    assert path.read_text() == expected
+
+
+def test_iter_obj_to_dataclass() -> None:
+    stream = dedent("""
+        msg: Hello
+        ---
+        msg: { FUNC: FileName }
+        ---
+        - not a dict
+        """)
+    documents = iter_obj_to_dataclass(Print, stream, filepath=Path(__file__))
+    assert next(documents) == Print("Hello")
+    assert next(documents) == Print("test_arguments.py")
+    with pytest.raises(RuntimeError, match=r"test_arguments\.py\[2\]: expected"):
+        next(documents)
+
+
+@dataclass
+class Service:
+    greeting: Print
+    tasks: list[Task]
+    sweep: list[Task]
+
+
+def test_incremental_decoder() -> None:
+    obj = {
+        "greeting": {"msg": "hello"},
+        "tasks": [
+            {"input": "a", "output": "b", "config": "c"},
+            {"input": "a", "output": "b", "config": "c"},
+        ],
+        "sweep": {
+            "FUNC": "Matrix",
+            "ARGS": {
+                "mapping": {"input": ["x.toml", "y.toml"]},
+                "template": {
+                    "input": placeholder("input"),
+                    "output": patsubst("%.toml", "%.png", placeholder("input")),
+                    "config": filename(),
+                },
+            },
+        },
+    }
+    decoder = IncrementalDecoder(Service, filepath=Path(__file__))
+    first = decoder.decode(copy.deepcopy(obj))
+    assert first == obj_to_dataclass(Service, obj, filepath=Path(__file__))
+    assert decoder.changed_paths == [()]
+    # 同じ内容の要素も別のオブジェクトのまま
+    assert first.tasks[0] is not first.tasks[1]
+
+    assert decoder.decode(copy.deepcopy(obj)) is first
+    assert decoder.changed_paths == []
+
+    obj["tasks"][1]["config"] = "d"
+    second = decoder.decode(copy.deepcopy(obj))
+    assert second == obj_to_dataclass(Service, obj, filepath=Path(__file__))
+    assert decoder.changed_paths == [("tasks", 1, "config")]
+    assert second.greeting is first.greeting
+    assert second.sweep is first.sweep
+    assert any(second.tasks[0] is task for task in first.tasks)
+    assert second.tasks[1].config == "d"
+
+    obj["sweep"]["ARGS"]["mapping"]["input"].append("z.toml")
+    del obj["greeting"]["msg"]
+    obj["greeting"]["msg"] = "bye"
+    third = decoder.decode(copy.deepcopy(obj))
+    assert third == obj_to_dataclass(Service, obj, filepath=Path(__file__))
+    assert decoder.changed_paths == [
+        ("greeting", "msg"),
+        ("sweep", "ARGS", "mapping", "input"),
+    ]
+    assert third.tasks == second.tasks
+    assert [task.output for task in third.sweep] == ["x.png", "y.png", "z.png"]
+
+
+def test_incremental_decoder_does_not_share_objects() -> None:
+    item = {"print": {"msg": "x"}, "secret": 1}
+    decoder = IncrementalDecoder(list[Main])
+    first = decoder.decode([copy.deepcopy(item), copy.deepcopy(item)])
+    second = decoder.decode([{**item, "secret": 2}, copy.deepcopy(item)])
+    assert decoder.changed_paths == [(0, "secret")]
+    assert second[1] is first[1]
+    assert second[0].secret == 2
+    assert second[0].print is not second[1].print
+    third = decoder.decode([copy.deepcopy(item), copy.deepcopy(item)])
+    assert third[0] is not third[1]
+    assert third[0].print is not third[1].print
+
+
+def test_incremental_decoder_wildcard(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.txt").write_text("")
+    decoder = IncrementalDecoder(dict[str, list[str]])
+    obj = {"files": wildcard("*.txt"), "fixed": ["x"]}
+    first = decoder.decode(copy.deepcopy(obj))
+    (tmp_path / "b.txt").write_text("")
+    second = decoder.decode(copy.deepcopy(obj))
+    assert decoder.changed_paths == []
+    # Wildcard はファイルシステムに依存するため、内容が同じでも評価し直す
+    assert len(second["files"]) == 2
+    assert len(first["files"]) == 1
+
+
+def test_decode_profile() -> None:
+    obj = {
+        "greeting": {"msg": "hello"},
+        "tasks": [{"input": "a", "output": "b", "config": "c"}] * 3,
+        "sweep": {
+            "FUNC": "Matrix",
+            "ARGS": {
+                "mapping": {"input": ["x.toml", "y.toml"]},
+                "template": {
+                    "input": placeholder("input"),
+                    "output": patsubst("%.toml", "%.png", placeholder("input")),
+                    "config": "c",
+                },
+            },
+        },
+    }
+    with DecodeProfile() as profile:
+        expected = obj_to_dataclass(Service, obj)
+    # `with` の外では記録しない
+    obj_to_dataclass(Service, obj)
+
+    rows = {(row["path"], row["function"]): row for row in profile.report()}
+    assert rows["<root>", None]["type"] == "Service"
+    assert rows["<root>", None] == profile.report()[0]
+    assert rows["tasks.list", None]["calls"] == 3
+    assert rows["sweep", "Matrix"]["calls"] == 1
+    assert rows["sweep.ARGS.template", None]["calls"] == 2
+    assert rows["sweep.ARGS.template.output", "PatSubst"]["calls"] == 2
+    root = rows["<root>", None]
+    assert root["self"] <= root["cumulative"]
+    assert sum(row["self"] for row in rows.values()) == pytest.approx(
+        root["cumulative"]
+    )
+    assert obj_to_dataclass(Service, obj) == expected
+
+
+def test_make_from_arguments_profile(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    config = tmp_path / "config.yaml"
+    config.write_text("msg: { FUNC: FileName }\n")
+    out = tmp_path / "profile.json"
+    argv = ["print.py", "--config", str(config), "--profile", str(out)]
+    monkeypatch.setattr(sys, "argv", argv)
+    monkeypatch.setenv("TELLURIUM_CACHE_DIR", str(tmp_path / "cache"))
+    assert make_from_arguments(Print) == Print("config.yaml")
+    report = json.loads(out.read_text())
+    assert [(row["path"], row["function"]) for row in report[:2]] == [
+        ("<root>", None),
+        ("msg", "FileName"),
+    ]
+    # プロファイルを取る場合はキャッシュを使わない
+    assert not (tmp_path / "cache").exists()
+
+
+@dataclass
+class Calibration:
+    gains: npt.NDArray[np.float64]
+    offsets: array.array[int]
+    table: np.ndarray[tuple[int, int], np.dtype[np.int32]]
+    raw: npt.NDArray = field(default_factory=lambda: np.zeros(0))
+
+
+def test_obj_to_dataclass_array() -> None:
+    obj = {
+        "gains": [1, 2.5, 3.0],
+        "offsets": [1, 2, 3],
+        "table": [[1, 2], [3, 4]],
+        "raw": {
+            "FUNC": "Matrix",
+            "ARGS": {"mapping": {"x": [1, 2]}, "template": placeholder("x")},
+        },
+    }
+    data = obj_to_dataclass(Calibration, obj)
+    assert data.gains.dtype == np.float64
+    assert data.gains.tolist() == [1.0, 2.5, 3.0]
+    assert data.offsets == array.array("q", [1, 2, 3])
+    assert data.table.dtype == np.int32
+    assert data.table.shape == (2, 2)
+    assert data.raw.tolist() == [1, 2]
+    assert isinstance_generic(data.gains, npt.NDArray[np.float64])
+    assert not isinstance_generic(data.table, npt.NDArray[np.float64])
+    assert isinstance_generic(data.offsets, array.array[int])
+
+    # 一括で変換できない要素は list と同じく 1 つずつ変換する
+    obj["gains"] = ["1.5", True]
+    assert obj_to_dataclass(Calibration, obj).gains.tolist() == [1.5, 1.0]
+    obj["gains"] = [1.0, "x"]
+    with pytest.raises(ValueError) as array_error:
+        obj_to_dataclass(Calibration, obj)
+    with pytest.raises(ValueError) as list_error:
+        obj_to_dataclass(list[float], obj["gains"])
+    assert str(array_error.value) == str(list_error.value)
+
+    obj["gains"] = [1.0]
+    obj["table"] = [[1], [2, 3]]
+    with pytest.raises(RuntimeError, match="<unknown>:table: cannot convert"):
+        obj_to_dataclass(Calibration, obj)
+    obj["table"] = []
+    obj["offsets"] = [2**70]
+    with pytest.raises(RuntimeError, match="<unknown>:offsets: cannot convert"):
+        obj_to_dataclass(Calibration, obj)
+
+
+def test_array_to_obj() -> None:
+    data = Calibration(
+        np.array([0.5, 1.0]), array.array("q", [1]), np.eye(2, dtype=np.int32)
+    )
+    expected = {
+        "gains": [0.5, 1.0],
+        "offsets": [1],
+        "table": [[1, 0], [0, 1]],
+        "raw": [],
+    }
+    assert asdict(data) == expected
+    stream = io.StringIO()
+    dump_yaml(data, stream)
+    assert yaml.safe_load(stream.getvalue()) == expected
+    assert dataclass_to_obj(Calibration)["offsets"] == ["<class 'int'>"]
+
+
+@dataclass
+class Dump:
+    print: Print
+    print_or_int: Union[Print, int]
+    list_union: list[Union[int, str]]
+    mapping: dict[str, list[Print]]
+    anything: Any
+    number: Optional[float] = None
+
+
+def test_asdict() -> None:
+    data = Dump(Print("a"), 42, [1, "2"], {"k": [Print("b")]}, {"x": [1]})
+    assert asdict(data) == {
+        "print": {"msg": "a"},
+        "print_or_int": {"TYPE": "int", "ARGS": 42},
+        "list_union": [{"TYPE": "int", "ARGS": 1}, {"TYPE": "str", "ARGS": "2"}],
+        "mapping": {"k": [{"msg": "b"}]},
+        "anything": {"x": [1]},
+        "number": {"TYPE": "NoneType", "ARGS": None},
+    }
+
+
+def test_dump_yaml() -> None:
+    data = [
+        Dump(Print("a"), Print("42"), ["yes", 1], {"k": []}, ["x", {"y": 1.5}], 3.0),
+        Dump(Print(""), 42, [], {}, None),
+    ]
+    stream = io.StringIO()
+    dump_yaml(data, stream)
+    expected = yaml.safe_dump(asdict(data), default_flow_style=False, sort_keys=False)
+    assert stream.getvalue() == expected
+
+
+@dataclass
+class Note:
+    text: str
+    payload: bytes
+
+
+def test_dump_yaml_block_style() -> None:
+    from tellurium._yamlio import BlockScalarStr
+    from tellurium._yamlio import dump as yaml_dump
+
+    data = Note(BlockScalarStr("line1\nline2\n"), b"\x00\x01" * 40)
+    stream = io.StringIO()
+    dump_yaml(data, stream)
+    # スタイルは `_yamlio.dump` と同じく保たれる
+    assert stream.getvalue() == yaml_dump(asdict(data))
+    assert "text: |\n  line1\n  line2\n" in stream.getvalue()
+    assert "payload: !!binary |" in stream.getvalue()
@@ -0,0 +1,117 @@
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from textwrap import dedent
+from typing import Optional, Union
+
+import pytest
+
+from tellurium.arguments import make_from_arguments
+from tellurium.cache import ConfigCache, schema_fingerprint
+
+
+@dataclass
+class Job:
+    name: str
+    inputs: list[str]
+    retries: Optional[int] = None
+
+
+def test_schema_fingerprint() -> None:
+    @dataclass
+    class Other:
+        name: str
+        inputs: list[str]
+        retries: Optional[int] = 3
+
+    assert schema_fingerprint(Job) == schema_fingerprint(Job)
+    assert schema_fingerprint(list[Job]) != schema_fingerprint(Job)
+    assert schema_fingerprint(Other) != schema_fingerprint(Job)
+    assert schema_fingerprint(Union[int, str]) != schema_fingerprint(Union[str, int])
+
+
+def test_config_cache_round_trip(tmp_path: Path) -> None:
+    cache = ConfigCache(tmp_path)
+    key = cache.key(Job, b"name: a")
+    assert key != cache.key(Job, b"name: b")
+    assert key != cache.key(list[Job], b"name: a")
+
+    with pytest.raises(KeyError):
+        cache.load(key)
+    assert cache.store(key, Job("a", ["x"]))
+    assert cache.load(key) == Job("a", ["x"])
+
+    # pickle できない値は保存しない
+    assert not cache.store(key, lambda: None)
+
+
+def test_config_cache_eviction(tmp_path: Path) -> None:
+    cache = ConfigCache(tmp_path, max_bytes=4096)
+    keys = [cache.key(Job, str(i).encode()) for i in range(8)]
+    for key in keys:
+        cache.store(key, Job("x" * 1000, []))
+    total = sum(p.stat().st_size for p in tmp_path.iterdir())
+    assert total <= 4096
+    cache.load(keys[-1])
+
+
+@dataclass
+class Jobs:
+    jobs: list[Job]
+    config: str
+    extra: list[str] = field(default_factory=list)
+
+
+def test_make_from_arguments_cache(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    config = tmp_path / "jobs.yaml"
+    config.write_text(
+        dedent("""
+        jobs:
+          - name: a
+            inputs: [x, y]
+        config: { FUNC: FileName }
+        """)
+    )
+    monkeypatch.setenv("TELLURIUM_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(sys, "argv", ["jobs.py", "--config", str(config)])
+
+    expected = Jobs([Job("a", ["x", "y"])], "jobs.yaml")
+    assert make_from_arguments(Jobs, cache=True) == expected
+    assert len(list((tmp_path / "cache").iterdir())) == 1
+    assert make_from_arguments(Jobs, cache=True) == expected
+
+    monkeypatch.setattr(sys, "argv", sys.argv + ["--no_cache"])
+    assert make_from_arguments(Jobs, cache=True) == expected
+
+    # 既定ではキャッシュしない
+    monkeypatch.setenv("TELLURIUM_CACHE_DIR", str(tmp_path / "default"))
+    assert make_from_arguments(Jobs) == expected
+    assert not (tmp_path / "default").exists()
+
+
+@dataclass
+class Located:
+    path: str
+    directory: str
+
+
+def test_make_from_arguments_cache_working_directory(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    config = tmp_path / "sub" / "c.yaml"
+    config.parent.mkdir()
+    config.write_text("path: {FUNC: FilePath}\ndirectory: {FUNC: FileDir}\n")
+    monkeypatch.setenv("TELLURIUM_CACHE_DIR", str(tmp_path / "cache"))
+
+    def decode(cwd: Path, path: str) -> Located:
+        monkeypatch.chdir(cwd)
+        monkeypatch.setattr(sys, "argv", ["located.py", "--config", path])
+        return make_from_arguments(Located, cache=True)
+
+    # 同じファイルでも指定したパスと作業ディレクトリごとに結果が異なる
+    for _ in range(2):
+        assert decode(tmp_path, "sub/c.yaml") == Located("sub/c.yaml", "sub/")
+        assert decode(config.parent, "c.yaml") == Located("c.yaml", "./")
+        assert decode(config.parent, "./c.yaml") == Located("c.yaml", "./")
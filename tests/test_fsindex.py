@@ -0,0 +1,130 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from tellurium.arguments import obj_to_dataclass
+from tellurium.fsindex import DirectoryIndex
+from tellurium.functional import path_to_str
+
+
+@pytest.fixture
+def tree(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    for name in [
+        "a.txt",
+        ".hidden",
+        "src/main.c",
+        "src/util.c",
+        "src/.git/config",
+        "src/lib/deep/x.c",
+        "data/b.txt",
+        "data/sub/c.txt",
+    ]:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(name)
+    (tmp_path / "empty").mkdir()
+    (tmp_path / "link").symlink_to("src", target_is_directory=True)
+    (tmp_path / "broken").symlink_to("missing")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [
+        "*",
+        "*.txt",
+        "*/",
+        "src/*.c",
+        "**",
+        "**/",
+        "**/*.c",
+        "**/**/*.c",
+        "**/lib/**/*.c",
+        "*/../*.txt",
+        "./src//*.c",
+        "link/*",
+        "missing/*",
+        "[ab]*",
+    ],
+)
+def test_glob_matches_pathlib(tree: Path, pattern: str) -> None:
+    expected = [path_to_str(path) for path in Path(".").glob(pattern)]
+    index = DirectoryIndex()
+    actual = [index.path_to_str(path) for path in index.glob(pattern)]
+    assert actual == expected
+
+
+def test_glob_invalid_pattern(tree: Path) -> None:
+    index = DirectoryIndex()
+    with pytest.raises(ValueError):
+        index.glob("")
+    with pytest.raises(ValueError):
+        index.glob("a**/b")
+    with pytest.raises(NotImplementedError):
+        index.glob("/tmp/*")
+
+
+def test_glob_reads_each_directory_once(
+    tree: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    calls = []
+    scandir = os.scandir
+
+    def counting_scandir(path):
+        calls.append(path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", counting_scandir)
+    index = DirectoryIndex()
+    for _ in range(3):
+        index.glob("**/*.c")
+        index.glob("src/*.c")
+    assert sorted(calls) == sorted(set(calls))
+
+
+def test_invalidate(tree: Path) -> None:
+    index = DirectoryIndex()
+    assert index.glob("data/*.txt") == [str(Path("data/b.txt"))]
+    (tree / "data" / "d.txt").write_text("")
+    assert index.glob("data/*.txt") == [str(Path("data/b.txt"))]
+
+    index.invalidate("data")
+    assert sorted(index.glob("data/*.txt")) == sorted(
+        str(path) for path in Path(".").glob("data/*.txt")
+    )
+
+
+def test_obj_to_dataclass_shared_index(tree: Path) -> None:
+    obj = {"FUNC": "Wildcard", "ARGS": {"pattern": "data/*.txt"}}
+    index = DirectoryIndex()
+    assert obj_to_dataclass(list[str], obj, fs_index=index) == ["data/b.txt"]
+    (tree / "data" / "b.txt").unlink()
+    assert obj_to_dataclass(list[str], obj, fs_index=index) == ["data/b.txt"]
+    index.invalidate()
+    assert obj_to_dataclass(list[str], obj, fs_index=index) == []
+
+
+@pytest.mark.parametrize("pattern", ["**", "**/*.c", "**/lib/**/*.c", "src/**/"])
+def test_glob_threads(tree: Path, pattern: str) -> None:
+    expected = DirectoryIndex().glob(pattern)
+    assert DirectoryIndex(threads=4).glob(pattern) == expected
+
+
+def test_glob_exclude(tree: Path) -> None:
+    index = DirectoryIndex()
+    assert str(Path("src/.git")) in index.glob("**")
+    paths = index.glob("**", exclude=[".git", "lib"])
+    assert not any(".git" in path or "lib" in path for path in paths)
+    assert index.glob("*.txt", exclude=["a.*"]) == []
+
+
+def test_obj_to_dataclass_wildcard_exclude(tree: Path) -> None:
+    obj = {"FUNC": "Wildcard", "ARGS": {"pattern": "src/**/*", "exclude": [".*"]}}
+    data = obj_to_dataclass(list[str], obj)
+    assert sorted(data) == sorted(
+        path_to_str(path)
+        for path in Path(".").glob("src/**/*")
+        if ".git" not in path.parts
+    )
@@ -0,0 +1,76 @@
+import random
+import re
+
+import pytest
+
+from tellurium import functional
+from tellurium.functional import PatSubst
+
+
+def pat_subst_regex(pattern: str, replacement: str, text: str) -> str:
+    regex = re.compile(f"^{pattern.replace('%', '(.*)')}$")
+    return regex.sub(replacement.replace("%", r"\1"), text)
+
+
+TEXTS = [
+    "",
+    "foo.c",
+    "src/foo.c",
+    "src/.c",
+    "src/foo.h",
+    "src/foo.c\n",
+    "src/foo.c\n\n",
+    "src/fo\no.c",
+    "\nsrc/foo.c",
+    "src/foo\x00.c",
+    "src/foo.c\x00",
+    "src/c",
+    "src/",
+    "srcxfoo.c",
+    "src/dir/foo.c",
+    "ソース/ファイル.c",
+]
+
+
+@pytest.mark.parametrize(
+    ("pattern", "replacement"),
+    [
+        ("src/%.c", "build/%.o"),
+        ("%.c", "%.o"),
+        ("s.c/%", "%"),
+        ("..c/%.", "<%>"),
+        ("%", "[%]"),
+        ("src/%.c", "%/%"),
+        ("src/%.c", "constant"),
+        ("%/", "%/simple_name.py"),
+        ("src/%.c", r"\g<1>.o"),
+        ("src/%.c", "%1"),
+        ("src/%%.c", "%.o"),
+    ],
+)
+@pytest.mark.parametrize("numpy", [False, True])
+def test_pat_subst_matches_regex(
+    monkeypatch: pytest.MonkeyPatch, pattern: str, replacement: str, numpy: bool
+) -> None:
+    if numpy:
+        monkeypatch.setattr(functional, "_NUMPY_MIN_TEXTS", 1)
+    rng = random.Random(0)
+    texts = [*TEXTS, *(rng.choice(TEXTS[1:5]) + str(i) for i in range(50))]
+    texts += [text[::-1] for text in texts]
+    clean = [text for text in texts if "\n" not in text and "\x00" not in text]
+
+    try:
+        expected = [pat_subst_regex(pattern, replacement, text) for text in texts]
+    except re.error:
+        with pytest.raises(re.error):
+            PatSubst(pattern, replacement, texts).run()
+        return
+
+    assert PatSubst(pattern, replacement, texts).run() == expected
+    assert PatSubst(pattern, replacement, clean).run() == [
+        pat_subst_regex(pattern, replacement, text) for text in clean
+    ]
+    for text in texts:
+        assert PatSubst(pattern, replacement, text).run() == pat_subst_regex(
+            pattern, replacement, text
+        )
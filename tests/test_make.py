@@ -0,0 +1,373 @@
+import json
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from tellurium import builddb
+from tellurium.make import (
+    BuildRule,
+    Make,
+    StatCache,
+    _RuleGraph,
+    needs_update,
+    run_rules,
+)
+
+
+def python(code: str) -> list[str]:
+    return [sys.executable, "-c", code]
+
+
+def touch(target: Path, *dependencies: Path, code: str = "") -> BuildRule:
+    script = f"{code}\nimport pathlib\npathlib.Path({str(target)!r}).touch()"
+    return BuildRule(target, list(dependencies), python(script))
+
+
+def wait_for(path: Path) -> str:
+    # `path` ができるまで待つ (他のルールと同時に実行されていないと失敗する)
+    return (
+        "import pathlib, time\n"
+        "deadline = time.monotonic() + 10\n"
+        f"while not pathlib.Path({str(path)!r}).exists():\n"
+        "    assert time.monotonic() < deadline, 'not run concurrently'\n"
+        "    time.sleep(0.01)\n"
+    )
+
+
+def test_run_rules_order(tmp_path: Path, capsys: pytest.CaptureFixture) -> None:
+    a, b, c = tmp_path / "a", tmp_path / "b", tmp_path / "c"
+    rules = [touch(c, a, b), touch(a), touch(b, a)]
+    for jobs in (1, 4):
+        for path in (a, b, c):
+            path.unlink(missing_ok=True)
+        run_rules(rules, jobs=jobs)
+        lines = capsys.readouterr().out.splitlines()
+        assert lines == [f"Running rule: {path}" for path in (a, b, c)]
+
+    run_rules(rules, jobs=4)
+    assert capsys.readouterr().out.splitlines() == [
+        f"Task {path} is up to date." for path in (a, b, c)
+    ]
+
+
+def test_run_rules_parallel(tmp_path: Path) -> None:
+    a, b, c = tmp_path / "a", tmp_path / "b", tmp_path / "c"
+    rules = [
+        touch(a, code=wait_for(b)),
+        touch(b, code=wait_for(a.with_suffix(".started"))),
+        touch(a.with_suffix(".started")),
+        touch(c, a, b),
+    ]
+    run_rules(rules, jobs=3)
+    assert a.stat().st_mtime <= c.stat().st_mtime
+    assert b.stat().st_mtime <= c.stat().st_mtime
+
+
+def test_run_rules_failure_drains(tmp_path: Path) -> None:
+    slow, failed = tmp_path / "slow", tmp_path / "failed"
+    after_failed, after_slow = tmp_path / "after_failed", tmp_path / "after_slow"
+    started = tmp_path / "started"
+    fail = (
+        "import os, pathlib\n"
+        f"pathlib.Path({str(started)!r}).write_text(str(os.getpid()))\n"
+        "raise SystemExit(3)"
+    )
+    # 失敗したコマンドが終了してから終わる
+    wait_exit = wait_for(started) + (
+        f"pid = int(pathlib.Path({str(started)!r}).read_text() or 0)\n"
+        "while pid and time.monotonic() < deadline:\n"
+        "    try:\n"
+        "        os.kill(pid, 0)\n"
+        "    except ProcessLookupError:\n"
+        "        break\n"
+        "    time.sleep(0.01)\n"
+        "time.sleep(0.2)\n"
+    )
+    rules = [
+        touch(slow, code="import os\n" + wait_exit),
+        touch(failed, code=fail),
+        touch(after_failed, failed),
+        touch(after_slow, slow),
+    ]
+    with pytest.raises(RuntimeError, match="failed with exit status 3"):
+        run_rules(rules, jobs=2)
+    # 実行中だったルールは最後まで実行され、新しいルールは始まらない
+    assert slow.exists()
+    assert not after_failed.exists()
+    assert not after_slow.exists()
+
+
+def test_run_rules_missing_dependency(tmp_path: Path) -> None:
+    rules = [touch(tmp_path / "a", tmp_path / "missing")]
+    for jobs in (1, 2):
+        with pytest.raises(RuntimeError, match="No rule to make target"):
+            run_rules(rules, jobs=jobs)
+
+
+def test_run_rules_cycle(tmp_path: Path) -> None:
+    a, b, c = tmp_path / "a", tmp_path / "b", tmp_path / "c"
+    rules = [touch(a, c), touch(b, a), touch(c, b)]
+    with pytest.raises(
+        RuntimeError, match=re.escape(f"Circular dependency: {a} -> {c} -> {b} -> {a}")
+    ):
+        run_rules(rules, dry_run=True)
+    with pytest.raises(RuntimeError, match="Circular dependency"):
+        run_rules([touch(a, a)], jobs=2)
+    assert not a.exists()
+
+
+def test_run_rules_deep_chain(capsys: pytest.CaptureFixture) -> None:
+    # 再帰の上限より深い依存関係
+    n = sys.getrecursionlimit() * 2
+    rules = [BuildRule(Path(f"{i}"), [Path(f"{i + 1}")], [f"{i}"]) for i in range(n)]
+    rules.append(BuildRule(Path(f"{n}"), [], [f"{n}"]))
+    run_rules(rules, dry_run=True)
+    assert capsys.readouterr().out.split() == [str(i) for i in reversed(range(n + 1))]
+
+
+def test_rule_graph_order() -> None:
+    n, fanout = 2_000, 10
+    paths = [Path(str(i)) for i in range(n)]
+    rules = {
+        str(path): BuildRule(
+            path,
+            [paths[i * j // (fanout + 1)] for j in range(1, fanout + 1) if i]
+            + [Path(f"{i}.c")],
+            [],
+        )
+        for i, path in enumerate(paths)
+    }
+    graph = _RuleGraph.compile(rules)
+    assert graph.sources == [[Path(f"{i}.c")] for i in range(n)]
+    order = graph.order()
+    assert sorted(order) == list(range(n))
+    position = {node: i for i, node in enumerate(order)}
+    assert all(
+        position[dep] < position[node] for node in order for dep in graph.deps[node]
+    )
+    # 実行済みのルールは含めない
+    assert graph.order({"0"}) == [i for i in order if i != 0]
+
+
+@pytest.fixture
+def shared(tmp_path: Path) -> tuple[list[BuildRule], list[Path]]:
+    """共通のヘッダに依存する、更新済みのルール"""
+    header = tmp_path / "common.h"
+    rules, files = [], [header]
+    for i in range(50):
+        source, target = tmp_path / f"{i}.c", tmp_path / f"{i}.o"
+        rules.append(touch(target, header, source))
+        files += [source, target]
+    for path in files:
+        path.touch()
+        # ターゲットの方が新しい
+        os.utime(path, (1000, 2000 if path.suffix == ".o" else 1000))
+    return rules, files
+
+
+def test_run_rules_stats_each_file_once(
+    shared: tuple[list[BuildRule], list[Path]], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    rules, files = shared
+    stats: list[str] = []
+    stat = os.stat
+
+    def counting_stat(path, *args, **kwargs):
+        stats.append(os.fspath(path))
+        return stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, "stat", counting_stat)
+    run_rules(rules)
+    assert sorted(stats) == sorted(map(str, files))
+
+
+def test_run_rules_prefill_stat(
+    shared: tuple[list[BuildRule], list[Path]],
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture,
+) -> None:
+    rules, files = shared
+    scanned: list[str] = []
+    scandir = os.scandir
+
+    def counting_scandir(path):
+        scanned.append(path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", counting_scandir)
+    run_rules(rules, prefill_stat=True)
+    assert scanned == [str(files[0].parent)]
+    assert "Running" not in capsys.readouterr().out
+
+    # コマンドで更新したファイルは後続のルールで stat し直す
+    everything = files[0].parent / "all"
+    everything.touch()
+    os.utime(everything, (3000, 3000))
+    files[1].touch()
+    run_rules([*rules, touch(everything, rules[0].target)], prefill_stat=True)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[:2] == [
+        f"Running rule: {rules[0].target}",
+        f"Task {rules[1].target} is up to date.",
+    ]
+    assert lines[-1] == f"Running rule: {everything}"
+
+
+def test_needs_update(tmp_path: Path) -> None:
+    source, target = tmp_path / "a.c", tmp_path / "a.o"
+    source.touch()
+    assert needs_update(target, [source])
+    target.touch()
+    os.utime(source, (0, 0))
+    cache = StatCache(prefill=True)
+    assert not needs_update(target, [source], cache)
+    os.utime(source, None)
+    assert not needs_update(target, [source], cache)
+    cache.invalidate(source)
+    assert needs_update(target, [source], cache)
+    with pytest.raises(FileNotFoundError):
+        needs_update(target, [tmp_path / "missing.c"], cache)
+
+
+def test_run_rules_signatures(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture
+) -> None:
+    source, obj, exe = tmp_path / "a.c", tmp_path / "a.o", tmp_path / "a.out"
+    db = tmp_path / "signatures.json"
+    source.write_text("int main;")
+    rules = [touch(exe, obj), touch(obj, source)]
+
+    hashed: list[str] = []
+    file_digest = builddb._file_digest
+
+    def counting_digest(path: str) -> str:
+        hashed.append(path)
+        return file_digest(path)
+
+    monkeypatch.setattr(builddb, "_file_digest", counting_digest)
+
+    def run(rules: list[BuildRule] = rules) -> list[str]:
+        hashed.clear()
+        run_rules(rules, signatures=db)
+        return capsys.readouterr().out.splitlines()
+
+    assert run() == [f"Running rule: {obj}", f"Running rule: {exe}"]
+    assert run() == [f"Task {obj} is up to date.", f"Task {exe} is up to date."]
+    # 更新時刻もサイズも変わっていなければ読み直さない
+    assert hashed == []
+
+    # 内容が同じであれば更新時刻が変わっても実行しない
+    os.utime(source, (10**10, 10**10))
+    assert run() == [f"Task {obj} is up to date.", f"Task {exe} is up to date."]
+    assert hashed == [str(source)]
+
+    # 作り直した a.o の内容は変わらないため a.out は実行しない
+    source.write_text("int main();")
+    assert run() == [f"Running rule: {obj}", f"Task {exe} is up to date."]
+
+    # コマンドが変わった場合も実行する
+    rules[1].command = [*rules[1].command, "# changed"]
+    assert run() == [f"Running rule: {obj}", f"Task {exe} is up to date."]
+
+    failing = touch(obj, source, code="raise SystemExit(1)")
+    with pytest.raises(RuntimeError):
+        run([rules[0], failing])
+    capsys.readouterr()
+    # 失敗したルールは入力が変わっていなくても次回実行する
+    assert run()[0] == f"Running rule: {obj}"
+
+
+def test_run_rules_signatures_without_record(
+    tmp_path: Path, capsys: pytest.CaptureFixture
+) -> None:
+    source, obj = tmp_path / "a.c", tmp_path / "a.o"
+    source.touch()
+    obj.touch()
+    os.utime(source, (0, 0))
+    db = tmp_path / "signatures.json"
+    # 記録がない場合は更新時刻で判定する
+    run_rules([touch(obj, source)], signatures=db)
+    assert capsys.readouterr().out == f"Task {obj} is up to date.\n"
+    assert json.loads(db.read_text())["targets"][str(obj)]["inputs"]
+    # 記録した後は更新時刻が新しくなっても内容で判定する
+    os.utime(source, None)
+    run_rules([touch(obj, source)], signatures=db)
+    assert capsys.readouterr().out == f"Task {obj} is up to date.\n"
+
+
+def test_make_watch(tmp_path: Path, capsys: pytest.CaptureFixture) -> None:
+    a, b = tmp_path / "a.c", tmp_path / "b.c"
+    a_o, b_o, exe = tmp_path / "a.o", tmp_path / "b.o", tmp_path / "a.out"
+    for path in (a, b):
+        path.touch()
+    rules = [touch(exe, a_o, b_o), touch(a_o, a), touch(b_o, b)]
+    make = Make({str(rule.target): rule for rule in rules})
+
+    def now() -> tuple[int, int]:
+        mtime = time.time() + 10
+        return mtime, mtime
+
+    def edit_a() -> None:
+        os.utime(a, now())
+
+    def remove_b() -> None:
+        b.unlink()
+
+    def restore_b() -> None:
+        b.touch()
+        os.utime(b, now())
+
+    steps = iter([edit_a, lambda: None, remove_b, restore_b])
+    outputs = []
+
+    def until() -> bool:
+        out, err = capsys.readouterr()
+        outputs.append((out.splitlines(), err.splitlines()))
+        step = next(steps, None)
+        if step is None:
+            return True
+        step()
+        return False
+
+    make.watch(0.01, until=until)
+    assert outputs == [
+        ([f"Running rule: {path}" for path in (a_o, b_o, exe)], []),
+        # 変更したソースの下流だけを実行する
+        ([f"Running rule: {a_o}", f"Running rule: {exe}"], []),
+        ([], []),
+        # 失敗しても監視を続ける
+        ([], [f"No rule to make target `{b}`"]),
+        ([f"Running rule: {b_o}", f"Running rule: {exe}"], []),
+    ]
+
+    # 失敗したために実行されなかったルールも、次の変更で実行する
+    a_src, a_out, b_out = tmp_path / "a.src", tmp_path / "a.out2", tmp_path / "b.out"
+    a_src.write_text("fail")
+    check = f"assert open({str(a_src)!r}).read() == 'ok'"
+    rules = [touch(a_out, a_src, code=check), touch(b_out)]
+    make = Make({str(rule.target): rule for rule in rules})
+
+    def fix_a() -> None:
+        a_src.write_text("ok")
+        os.utime(a_src, now())
+
+    steps = iter([fix_a])
+    outputs.clear()
+    make.watch(0.01, until=until)
+    assert outputs[0][0] == [f"Running rule: {a_out}"]
+    assert outputs[0][1][-1] == f"Rule `{a_out}` failed with exit status 1"
+    assert outputs[1] == ([f"Running rule: {a_out}", f"Running rule: {b_out}"], [])
+    assert b_out.exists()
+
+
+def test_rule_graph_affected(tmp_path: Path) -> None:
+    a, b, c, d = (tmp_path / name for name in "abcd")
+    rules = [touch(c, a, b), touch(b), touch(d, c, a), touch(a, tmp_path / "src")]
+    graph = _RuleGraph.compile({str(rule.target): rule for rule in rules})
+    affected = graph.affected([str(tmp_path / "src")])
+    assert {graph.names[i] for i in affected} == {str(a), str(c), str(d)}
+    assert graph.affected([str(tmp_path / "other")]) == set()
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+# 起動時には読み込まないモジュール
+DEFERRED_MODULES = {
+    "yaml",
+    "argparse",
+    "string",
+    "concurrent.futures",
+    "multiprocessing",
+    "pickle",
+    "hashlib",
+    "subprocess",
+    "numpy",
+    "matplotlib",
+    "tellurium.functional",
+    "tellurium.cache",
+}
+
+
+def imported_modules(args: list[str], env: dict[str, str]) -> set[str]:
+    """`python -X importtime` で実行したときに読み込まれたモジュール"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        modules.add(line.rsplit("|", 1)[1].strip())
+    return modules
+
+
+@pytest.fixture
+def env(tmp_path: Path) -> dict[str, str]:
+    env = dict(os.environ)
+    env["TELLURIUM_CACHE_DIR"] = str(tmp_path / "cache")
+    return env
+
+
+def test_import_arguments(env: dict[str, str]) -> None:
+    # 読み込み時間は benchmarks/test_bench_startup.py で計測する
+    modules = imported_modules(
+        ["-c", "import tellurium.arguments, tellurium.make"], env
+    )
+    assert "tellurium.arguments" in modules
+    assert DEFERRED_MODULES.isdisjoint(modules), DEFERRED_MODULES & modules
+
+
+def test_cached_config_does_not_import_yaml(
+    tmp_path: Path, env: dict[str, str]
+) -> None:
+    config = tmp_path / "make.yaml"
+    config.write_text("[]\n")
+    args = ["-m", "tellurium.make", "--config", str(config)]
+    assert "yaml" in imported_modules(args, env)
+    assert "yaml" not in imported_modules(args, env)